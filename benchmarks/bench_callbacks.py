@@ -0,0 +1,151 @@
+"""Benchmark of the figure functions of the app.
+
+Calls figure_one to figure_six directly for a matrix of dropdown inputs and countries and reports, per figure,
+the p50/p95/p99 latency, the peak memory of a call and the size of the figure JSON sent to the browser.
+
+    python benchmarks/bench_callbacks.py --save benchmarks/baseline.json
+    python benchmarks/bench_callbacks.py --compare benchmarks/baseline.json --threshold 0.25
+
+With --compare the run fails when a figure got slower, used more memory or sends more bytes than
+the baseline by more than the threshold.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+# The figure cache and the data reload would measure the disk instead of the figures
+os.environ["FIGURE_CACHE_MAX_MB"] = "0"
+os.environ["DATA_RELOAD_INTERVAL"] = "0"
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import plotly.io as pio  # noqa: E402
+
+import app  # noqa: E402
+
+# The measures compared against the baseline, all lower is better
+GATED_MEASURES = ["p95_ms", "peak_memory_kb", "json_bytes_max"]
+
+
+def input_matrix():
+    """Dropdown inputs of the benchmark: no filters, single and multi year, sport subsets and seasons."""
+    years = sorted(app.current_data.grouped_final_athlete_events["Year"].unique().tolist())
+    sports = app.current_data.grouped_final_athlete_events.groupby("Sport", observed=True)["Number of Medals"].sum()
+    popular_sports = sports.sort_values(ascending=False).index.tolist()
+    year_choices = [None, [years[-1]], years[-3:], years[:5]]
+    sport_choices = [None, popular_sports[:1], popular_sports[:3]]
+    season_choices = [None, ["Summer"], ["Winter"], ["Summer", "Winter"]]
+    return list(itertools.product(year_choices, sport_choices, season_choices))
+
+
+def country_choices():
+    """Countries of the country graphs: the default Sweden, the country with the most medals and one with few."""
+    medals = app.current_data.grouped_final_athlete_events.groupby("Country", observed=True)["Number of Medals"].sum()
+    medals = medals[medals > 0].sort_values(ascending=False)
+    return list(dict.fromkeys(["Sweden", medals.index[0], medals.index[len(medals) * 3 // 4]]))
+
+
+def figure_cases():
+    """All calls of the benchmark as (figure name, function, arguments), with every sort and country option."""
+    countries = country_choices()
+    for years, sports, season in input_matrix():
+        for sort in ["Country", "Sport"]:
+            yield "figure_one", app.figure_one, (years, sports, season, sort)
+        for country in countries:
+            for sort in ["Medals", "Sports"]:
+                yield "figure_two", app.figure_two, (years, sports, season, sort, country)
+            yield "figure_three", app.figure_three, (years, sports, season, country)
+            yield "figure_four", app.figure_four, (years, sports, season, country)
+        yield "figure_five", app.figure_five, (years, sports, season)
+        if season is None:
+            # figure_six has no season input, so it is only run once per year and sport selection
+            for sort in [None, "Medals", "Gender ratio"]:
+                yield "figure_six", app.figure_six, (years, sports, sort)
+
+
+def clear_filtered_views():
+    app._filtered_view.cache_clear()
+    app._filtered_rows.cache_clear()
+
+
+def run(repeat):
+    samples = {}
+    for name, figure, arguments in figure_cases():
+        result = samples.setdefault(name, {"latency": [], "memory": [], "bytes": []})
+        for _ in range(repeat):
+            # Every call starts without the filtered views of earlier calls
+            clear_filtered_views()
+            start = time.perf_counter()
+            fig = figure(*arguments)
+            result["latency"].append((time.perf_counter() - start) * 1000)
+        # Memory is measured in a separate call, tracing slows down the code being timed
+        clear_filtered_views()
+        tracemalloc.start()
+        fig = figure(*arguments)
+        result["memory"].append(tracemalloc.get_traced_memory()[1] / 1024)
+        tracemalloc.stop()
+        result["bytes"].append(len(pio.to_json(fig, validate=False)))
+
+    return {
+        name: {
+            "calls": len(result["latency"]),
+            "p50_ms": float(np.percentile(result["latency"], 50)),
+            "p95_ms": float(np.percentile(result["latency"], 95)),
+            "p99_ms": float(np.percentile(result["latency"], 99)),
+            "peak_memory_kb": float(max(result["memory"])),
+            "json_bytes_mean": float(np.mean(result["bytes"])),
+            "json_bytes_max": int(max(result["bytes"])),
+        }
+        for name, result in samples.items()
+    }
+
+
+def compare(results, baseline, threshold):
+    """Return a line for every measure that regressed by more than threshold compared to the baseline."""
+    regressions = []
+    for name, measures in results.items():
+        for measure in GATED_MEASURES:
+            before = baseline.get(name, {}).get(measure)
+            if before and measures[measure] > before * (1 + threshold):
+                regressions.append(f"{name} {measure}: {before:.1f} -> {measures[measure]:.1f} "
+                                   f"(+{measures[measure] / before - 1:.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the figure functions of the app.")
+    parser.add_argument("--repeat", type=int, default=3, help="timed calls per input combination")
+    parser.add_argument("--save", help="write the results as JSON, e.g. as a new baseline")
+    parser.add_argument("--compare", help="baseline JSON to compare the results with")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed regression, 0.25 is 25%%")
+    args = parser.parse_args()
+
+    results = run(args.repeat)
+    print(f"{'figure':<14}{'calls':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'peak KB':>10}{'JSON KB':>10}")
+    for name, measures in results.items():
+        print(f"{name:<14}{measures['calls']:>7}{measures['p50_ms']:>10.1f}{measures['p95_ms']:>10.1f}"
+              f"{measures['p99_ms']:>10.1f}{measures['peak_memory_kb']:>10.0f}{measures['json_bytes_max'] / 1024:>10.0f}")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"python": platform.python_version(), "data_version": app.current_data.version, "results": results}, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\nRegressions of more than {args.threshold:.0%} against {args.compare}:")
+            print("\n".join(regressions))
+            sys.exit(1)
+        print(f"\nNo regressions of more than {args.threshold:.0%} against {args.compare}")
+
+
+if __name__ == "__main__":
+    main()
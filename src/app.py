@@ -1,26 +1,49 @@
 # Imports of needed libraries
-from dash import Dash, html, dcc, callback, Output, Input
+import os
+import threading
+import time
+from functools import lru_cache
+from urllib.parse import urlencode
+from flask import Response, g, redirect, request, stream_with_context
+from flask_compress import Compress
+from dash import Dash, html, dcc, callback, ctx, no_update, ClientsideFunction, Output, Input, State
 import dash_bootstrap_components as dbc
 import plotly.express as px
+import plotly.io as pio
+import numpy as np
 import pandas as pd
 from dash_bootstrap_templates import load_figure_template
+from app_data import AppData
+from tile_cache import TILE_SOURCES, TileCache
+from export import EXPORT_FORMATS, ExportSlots, parse_columns, parse_filters, parse_page, stream_rows
+from data_store import CACHE_DIR, data_version, has_cache
+from figure_cache import FigureCache, normalize
+from clientside import CLIENTSIDE_FIGURES, encode_events
+from background import SharedJobManager
+from metrics import Metrics
 
 ############### Preparation of dataframes for the app ###############
 
-# Read the required datafiles for the app
-athlete_events = pd.read_csv("../data/final_df.csv", low_memory=False)
-gender_ratios = pd.read_csv("../data/gender_ratios.csv")
+# The dataframes and indexes of the current version of the data. A reload replaces the whole object,
+# so functions take it once into a local variable and use that for all frames and indexes of a request
+current_data = AppData(data_version())
 
-# Changing the NaN values in the Medal column to "No Medal"
-athlete_events['Medal'] = athlete_events['Medal'].fillna('No Medal')
-# Creating column Number of Medals and mapping the Medal column to values of 1 for medal and 0 for NaN value
-athlete_events['Number of Medals'] = athlete_events['Medal'].map({'Gold': 1, 'Silver': 1, 'Bronze': 1, 'No Medal': 0})
+# Bump when the figure functions change, so figures cached by an older version of the app are not served
+FIGURES_VERSION = 2
 
-# Grouping to get the final dataframe for the app - sum of participants and number of medals count for the desired columns
-grouped_final_athlete_events = athlete_events.groupby(['Year','Season', 'Medal', 'Country', 'Sport', 'Country_latitude', 'Country_longitude']).agg({
-    'Participants': 'nunique',
-    'Number of Medals': 'sum'}).reset_index()
+# Cache of the figures on disk shared by all workers, FIGURE_CACHE_MAX_MB=0 turns it off
+figure_cache = FigureCache(
+    os.environ.get("FIGURE_CACHE_DIR", os.path.join(CACHE_DIR, "figures")),
+    max_bytes=int(os.environ.get("FIGURE_CACHE_MAX_MB", "200")) * 1024 * 1024,
+    version=f"{current_data.version}-figures{FIGURES_VERSION}",
+)
 
+# Timings of the callbacks for the /metrics route, callbacks slower than SLOW_CALLBACK_MS are logged with their inputs.
+# The workers share their metrics in METRICS_DIR, so /metrics shows all workers whichever one answers the scrape
+metrics = Metrics(
+    slow_callback_ms=float(os.environ["SLOW_CALLBACK_MS"]) if "SLOW_CALLBACK_MS" in os.environ else None,
+    directory=os.environ.get("METRICS_DIR", os.path.join(CACHE_DIR, "metrics")) or None,
+)
 
 
 ############### Creating the app ###############
@@ -39,420 +62,760 @@ app = Dash(__name__,
 # Needs to be included for deploying on render
 server = app.server
 
-# Layout for App
-app.layout = dbc.Container([
+# Basemap tiles of the maps are served by the app from a cache on disk, see the /tiles route.
+# With TILE_OFFLINE=1 only the tiles already in TILE_CACHE_DIR are served
+tile_cache = TileCache(
+    os.environ.get("TILE_CACHE_DIR", os.path.join(CACHE_DIR, "tiles")),
+    max_bytes=int(os.environ.get("TILE_CACHE_MAX_MB", "500")) * 1024 * 1024,
+    offline=os.environ.get("TILE_OFFLINE", "0") == "1",
+)
 
-    ################# Header ##################
-    dbc.Row(
-        [html.H1("Olympic Games Achievements 1896-2016", className="text-center text-primary")],
-        className="mb-3 mt-3", # Adding marginal bottom and top
-    ),
-    ################# Dropdown row ##############
-    dbc.Row(
-    [
-        dbc.Col(
-            dcc.Dropdown(
-                id='year_dropdown',
-                className='text-info mt-1',
-                multi=True, 
-                options=[{'label': year, 'value': year} for year in sorted(athlete_events['Year'].unique())], 
-                placeholder='Select Year',
-                style={'width': '100%'},
-            ),
-            xs=12, sm=6, md=4, lg=3
+# The figures are sent compressed with brotli or gzip, whichever the browser accepts.
+# Dash's own compress=True only offers gzip, so flask-compress is set up here instead
+server.config.update(
+    COMPRESS_ALGORITHM=["br", "gzip"], COMPRESS_BR_LEVEL=5, COMPRESS_LEVEL=6,
+    # The responses of Dash and the text formats of the export route
+    COMPRESS_MIMETYPES=["text/html", "text/css", "text/plain", "text/javascript", "application/javascript",
+                        "application/json", "text/csv", "application/x-ndjson"],
+)
+Compress(server)
+
+# orjson serializes the numpy arrays of the figures a lot faster than the json module
+pio.json.config.default_engine = "orjson"
+
+############### Hot reload of new data ###############
+
+# Seconds between the checks of every worker for new data, e.g. added by ingest.py, 0 turns the checks off
+DATA_RELOAD_INTERVAL = float(os.environ.get("DATA_RELOAD_INTERVAL", "30"))
+last_data_check = time.monotonic()
+data_reload_lock = threading.Lock()
+# A new version without a cache, which is only built when the next check still finds the same version
+pending_version = None
+
+@server.before_request
+def reload_new_data():
+    global last_data_check, pending_version
+    if DATA_RELOAD_INTERVAL <= 0 or time.monotonic() - last_data_check < DATA_RELOAD_INTERVAL:
+        return
+    # Only one thread of the worker checks, the others go on with the current data
+    if not data_reload_lock.acquire(blocking=False):
+        return
+    reloading = False
+    try:
+        last_data_check = time.monotonic()
+        new_version = data_version()
+        # ingest.py writes the cache before it moves the new files in place. Until all of them are there the
+        # version has no cache, and building that version would only be a full rebuild of an unfinished state
+        stable = has_cache(new_version) or new_version == pending_version
+        pending_version = new_version
+        if new_version != current_data.version and stable:
+            # The new data is loaded in a thread, also when its cache still has to be built, so no request waits for it.
+            # Requests are served with the current data until the new data replaces it
+            threading.Thread(target=reload_data, args=(new_version,), daemon=True).start()
+            reloading = True
+    finally:
+        # While reloading, the thread releases the lock when it is done
+        if not reloading:
+            data_reload_lock.release()
+
+def reload_data(new_version):
+    global current_data
+    try:
+        current_data = AppData(new_version)
+        # The cached views and the encoded store are keyed on the old data and would keep all of it in memory,
+        # also the memory-mapped columns of its removed cache folder
+        _filtered_view.cache_clear()
+        _filtered_rows.cache_clear()
+        events_store.cache_clear()
+        # Changed after the data, so figures of the old data are never cached under the new version
+        figure_cache.version = f"{new_version}-figures{FIGURES_VERSION}"
+        # The figures of the first page load are built for the new data
+        default_figures(new_version)
+    finally:
+        data_reload_lock.release()
+
+# With CLIENTSIDE_FILTERING=1 the grouped medals are sent to the browser once,
+# which then filters them and builds the sunburst and bar graphs without asking the server
+CLIENTSIDE_FILTERING = os.environ.get("CLIENTSIDE_FILTERING", "0") == "1"
+
+# With BACKGROUND_CALLBACKS=1 the maps are built in background processes instead of in the web worker.
+# Identical jobs of different sessions run once, and a job is stopped when its session has moved on
+BACKGROUND_CALLBACKS = os.environ.get("BACKGROUND_CALLBACKS", "0") == "1"
+BACKGROUND_FIGURES = ["graph_mapbox_2", "graph_gender_or_medals_mapbox"]
+
+@lru_cache(maxsize=1)
+def events_store(data):
+    # Encoded once per version of the data instead of on every page load
+    return encode_events(data.grouped_final_athlete_events)
+
+# Headers of the graphs of the chosen country
+def country_headers(country):
+    return [f"Medals {country}", f"{country} top 10 all Medals", f"{country} top 10 Gold Medals"]
+
+# Layout for App, built on every page load so it shows the years and sports of the latest data
+def serve_layout():
+    data = current_data
+    grouped_final_athlete_events, gender_ratio_years = data.grouped_final_athlete_events, data.gender_ratio_years
+    first_year, last_year = grouped_final_athlete_events['Year'].min(), grouped_final_athlete_events['Year'].max()
+    # The figures of the default dropdowns are part of the layout, so the first page load runs no callbacks
+    figures = default_figures(data.version)
+    country = DEFAULT_VALUES['country_dropdown']
+    return dbc.Container([
+
+        ################# Header ##################
+        dbc.Row(
+            [html.H1(f"Olympic Games Achievements {first_year}-{last_year}", className="text-center text-primary")],
+            className="mb-3 mt-3", # Adding marginal bottom and top
         ),
-        dbc.Col(
-            dcc.Dropdown(
-                id='sport_dropdown',
-                className='text-info mt-1',
-                multi=True, 
-                options=[{'label': sport, 'value': sport} for sport in sorted(athlete_events['Sport'].unique())], 
-                placeholder='Select Sport',
-                style={'width': '100%'},
+        ################# Dropdown row ##############
+        dbc.Row(
+        [
+            dbc.Col(
+                dcc.Dropdown(
+                    id='year_dropdown',
+                    className='text-info mt-1',
+                    multi=True, 
+                    options=[{'label': year, 'value': year} for year in sorted(grouped_final_athlete_events['Year'].unique())], 
+                    placeholder='Select Year',
+                    style={'width': '100%'},
+                ),
+                xs=12, sm=6, md=4, lg=3
             ),
-            xs=12, sm=6, md=4, lg=3
-        ),
-        dbc.Col(
-            dcc.Dropdown(
-                id='season_dropdown',
-                className='text-info mt-1',
-                multi=True, 
-                options=['Summer', 'Winter'], 
-                placeholder='Select Season',
-                style={'width': '100%'},
+            dbc.Col(
+                dcc.Dropdown(
+                    id='sport_dropdown',
+                    className='text-info mt-1',
+                    multi=True, 
+                    options=[{'label': sport, 'value': sport} for sport in sorted(grouped_final_athlete_events['Sport'].unique())], 
+                    placeholder='Select Sport',
+                    style={'width': '100%'},
+                ),
+                xs=12, sm=6, md=4, lg=3
             ),
-            xs=12, sm=6, md=4, lg=3
-        ),
-    ],
-    justify='center',
-    style={'margin-left': '10px', 'margin-right': '10px'},
-    className="sticky-top mb-2" #Sticky-top to fix it to the top of the window
-),
-
-    ############# Graphs ################
-
-    dbc.Row([
-        dbc.Col(
-            dbc.Card([ # To make a "card" or a frame to the object inside
-                    dbc.CardHeader(html.H3("Medals All Countries", className="text-body-tertiary", id="header_graph_all_countries")),
-                    dbc.CardBody([
-                    dcc.Dropdown(id='country_dropdown_right', 
-                    className='mb-1 mt-1 text-info',
-                    options=[
-                    {'label': 'Sort by Sports', 'value': 'Sport'},
-                    {'label': 'Sort by Countries', 'value': 'Country'}],
-                    value='Country',
-                    placeholder='Sort by Country or Sport',
+            dbc.Col(
+                dcc.Dropdown(
+                    id='season_dropdown',
+                    className='text-info mt-1',
+                    multi=True, 
+                    options=['Summer', 'Winter'], 
+                    placeholder='Select Season',
                     style={'width': '100%'},
-            ), 
-                        dcc.Graph(id="graph_all_countries_sunburst", figure={}),
-                        ])
-            ], className="mb-3"
-            ),xs=12, sm=11, md=10, lg=5
-        ),
-        dbc.Col(
-            dbc.Card([
-                    dbc.CardHeader(html.H3("Medals Sweden", className="text-body-tertiary", id="header_graph_sweden")),
-                    dbc.CardBody([
-                        dcc.Dropdown(
-                        id='sport_or_medal_dropdown', 
-                        className='text-info mt-1 mb-1', 
+                ),
+                xs=12, sm=6, md=4, lg=3
+            ),
+            dbc.Col(
+                dcc.Dropdown(
+                    id='country_dropdown',
+                    className='text-info mt-1',
+                    options=sorted(grouped_final_athlete_events['Country'].unique()), 
+                    value=DEFAULT_VALUES['country_dropdown'],
+                    clearable=False, # The country graphs always show a country
+                    placeholder='Select Country',
+                    style={'width': '100%'},
+                ),
+                xs=12, sm=6, md=4, lg=3
+            ),
+        ],
+        justify='center',
+        style={'margin-left': '10px', 'margin-right': '10px'},
+        className="sticky-top mb-2" #Sticky-top to fix it to the top of the window
+    ),
+
+        ############# Graphs ################
+
+        dbc.Row([
+            dbc.Col(
+                dbc.Card([ # To make a "card" or a frame to the object inside
+                        dbc.CardHeader(html.H3("Medals All Countries", className="text-body-tertiary", id="header_graph_all_countries")),
+                        dbc.CardBody([
+                        dcc.Dropdown(id='country_dropdown_right', 
+                        className='mb-1 mt-1 text-info',
                         options=[
-                            {'label': 'Sort by Sports', 'value': 'Sports'},
-                            {'label': 'Sort by Medals', 'value': 'Medals'}
-                        ], 
-                        value='Medals',
-                        placeholder='Sort by Sports or Medals',
-                        style={'width': '100%'}),
-                        dcc.Graph(id="graph_sweden_sunburst", figure={}),
-                        ]), 
-            ], className="mb-3"
-            ),xs=12, sm=11, md=10, lg=5
-        ),
-    ], justify='evenly', className="container-fluid"),  # Added container-fluid class for better responsiveness
-
-    dbc.Row([
-        dbc.Col(
-            dbc.Card([
-                    dbc.CardHeader(html.H3("Sweden top 10 all Medals", className="text-body-tertiary", id="header_graph_sweden_top10")),
-                    dbc.CardBody([
-                                 dcc.Graph(id="graph_sweden_top10", figure={}),
-                    ]),
-                ],
-                className="mb-3",
-            ), xs=12, sm=11, md=10, lg=5
-        ),
-        dbc.Col(
-            dbc.Card([
-                    dbc.CardHeader(html.H3("Sweden top 10 Gold Medals", className="text-body-tertiary", id="header_graph_sweden_gold")),
-                    dbc.CardBody([
-                                 dcc.Graph(id="graph_sweden_gold", figure={}),
-                    ]),
-                ],
-                className="mb-3",
-            ), xs=12, sm=11, md=10, lg=5
-        ),
-    ], justify='evenly', className="container-fluid mb-3"),  # Added container-fluid class for better responsiveness
-
- ############## Mapbox Graphs ###############
-    dbc.Row([
-            html.H4("Number of Participants and Medals by Country"),
-            dcc.Graph(
-                id="graph_mapbox_2",    
-                figure={}, 
+                        {'label': 'Sort by Sports', 'value': 'Sport'},
+                        {'label': 'Sort by Countries', 'value': 'Country'}],
+                        value=DEFAULT_VALUES['country_dropdown_right'],
+                        placeholder='Sort by Country or Sport',
+                        style={'width': '100%'},
+                ), 
+                            dcc.Graph(id="graph_all_countries_sunburst", figure=figures["graph_all_countries_sunburst"]),
+                            ])
+                ], className="mb-3"
+                ),xs=12, sm=11, md=10, lg=5
+            ),
+            dbc.Col(
+                dbc.Card([
+                        dbc.CardHeader(html.H3(country_headers(country)[0], className="text-body-tertiary", id="header_graph_sweden")),
+                        dbc.CardBody([
+                            dcc.Dropdown(
+                            id='sport_or_medal_dropdown', 
+                            className='text-info mt-1 mb-1', 
+                            options=[
+                                {'label': 'Sort by Sports', 'value': 'Sports'},
+                                {'label': 'Sort by Medals', 'value': 'Medals'}
+                            ], 
+                            value=DEFAULT_VALUES['sport_or_medal_dropdown'],
+                            placeholder='Sort by Sports or Medals',
+                            style={'width': '100%'}),
+                            dcc.Graph(id="graph_sweden_sunburst", figure=figures["graph_sweden_sunburst"]),
+                            ]), 
+                ], className="mb-3"
+                ),xs=12, sm=11, md=10, lg=5
             ),
-        ], className="mx-2 mb-3"),
-
-     dbc.Row([
-            html.H4("Number of Participants and Gender Distribution by Country"),
-            dcc.Dropdown(
-                id='country_dropdown_left', 
-                className='mb-1 text-info', 
-                options=["Medals", "Gender ratio"], 
-                placeholder='Sort by medals or gender ratio',
-                style={'width': '260px'},
+        ], justify='evenly', className="container-fluid"),  # Added container-fluid class for better responsiveness
+
+        dbc.Row([
+            dbc.Col(
+                dbc.Card([
+                        dbc.CardHeader(html.H3(country_headers(country)[1], className="text-body-tertiary", id="header_graph_sweden_top10")),
+                        dbc.CardBody([
+                                     dcc.Graph(id="graph_sweden_top10", figure=figures["graph_sweden_top10"]),
+                        ]),
+                    ],
+                    className="mb-3",
+                ), xs=12, sm=11, md=10, lg=5
             ),
-            dcc.Graph(
-                id="graph_gender_or_medals_mapbox", 
-                figure={}
+            dbc.Col(
+                dbc.Card([
+                        dbc.CardHeader(html.H3(country_headers(country)[2], className="text-body-tertiary", id="header_graph_sweden_gold")),
+                        dbc.CardBody([
+                                     dcc.Graph(id="graph_sweden_gold", figure=figures["graph_sweden_gold"]),
+                        ]),
+                    ],
+                    className="mb-3",
+                ), xs=12, sm=11, md=10, lg=5
             ),
-        ],className="mx-2 mb-3"),
+        ], justify='evenly', className="container-fluid mb-3"),  # Added container-fluid class for better responsiveness
+
+     ############## Mapbox Graphs ###############
+        dbc.Row([
+                html.H4("Number of Participants and Medals by Country"),
+                dcc.Graph(
+                    id="graph_mapbox_2",    
+                    figure=figures["graph_mapbox_2"], 
+                ),
+            ], className="mx-2 mb-3"),
+
+         dbc.Row([
+                html.H4("Number of Participants and Gender Distribution by Country"),
+                dcc.Dropdown(
+                    id='country_dropdown_left', 
+                    className='mb-1 text-info', 
+                    options=["Medals", "Gender ratio"], 
+                    placeholder='Sort by medals or gender ratio',
+                    style={'width': '260px'},
+                ),
+                dcc.Graph(
+                    id="graph_gender_or_medals_mapbox", 
+                    figure=figures["graph_gender_or_medals_mapbox"]
+                ),
+                # Year of the gender ratio map, only shown for the gender ratios. Every year is fetched when it is chosen
+                html.Div([
+                    dbc.Button("Play", id="gender_play_button", size="sm", style={'width': '80px'}),
+                    html.Div(dcc.Slider(
+                        id="gender_year_slider",
+                        min=min(gender_ratio_years),
+                        max=max(gender_ratio_years),
+                        step=None, # Only the years with Games can be chosen
+                        marks={int(year): str(year) if i % 4 == 0 else "" for i, year in enumerate(gender_ratio_years)},
+                        value=min(gender_ratio_years),
+                    ), style={'flex': 1}),
+                    dcc.Interval(id="gender_play_interval", interval=1000, disabled=True),
+                ], id="gender_year_controls", style={'display': 'none'}),
+            ],className="mx-2 mb-3"),
   
-  ########## Reset button and link to GitHub ##############
-    dbc.Row([
-            dbc.Button("Reset", 
-                    id='reset-button', 
-                    href="https://iths-olympics.onrender.com",   
-                    title='Resets all graphs',
-                    style={'width': '150px'}), # Hover text
+      ########## Reset button and link to GitHub ##############
+        dbc.Row([
+                dbc.Button("Reset", 
+                        id='reset-button', 
+                        href="https://iths-olympics.onrender.com",   
+                        title='Resets all graphs',
+                        style={'width': '150px'}), # Hover text
 
-            dcc.Link("Contributors", 
-                    href="https://github.com/DeerBay/OS-Project/graphs/contributors", 
-                    target="_blank", # "_blank": Opens the linked document in a new tab or window.
-                    title='Link to repository on GitHub',
-                    className='text-center'), 
-        ],className='mb-3', justify='center'),
+                dcc.Link("Contributors", 
+                        href="https://github.com/DeerBay/OS-Project/graphs/contributors", 
+                        target="_blank", # "_blank": Opens the linked document in a new tab or window.
+                        title='Link to repository on GitHub',
+                        className='text-center'), 
+            ],className='mb-3', justify='center'),
 
-], 
-fluid=True
-) # End of container 
+        # The grouped medals for the client-side mode, empty otherwise
+        dcc.Store(id="events_store", data=events_store(data) if CLIENTSIDE_FILTERING else None),
 
-############ Callback Decoraters to define functions ############ 
+    ], 
+    fluid=True
+    ) # End of container 
 
+############ Functions building the figures ############ 
 
-# Figure one; Sunburst graph sorted by number of medals per country per sport/year
-@callback(
-    Output("graph_all_countries_sunburst", "figure"),
-    Input("year_dropdown", "value"),
-    Input("sport_dropdown", "value"),
-    Input("season_dropdown", "value"),
-    Input("country_dropdown_right", "value"),
+def filtered_view(data, years=None, sports=None, season=None, country=None):
+    # All figures of one interaction share the same filter state, so the filtered rows are only computed once
+    return _filtered_view(data.events_index, *filter_key(years, sports, season, country))
 
-)
+
+def filtered_rows(data, years=None, sports=None, season=None, country=None):
+    # Row positions of the filtered view, None without any filter
+    return _filtered_rows(data.events_index, *filter_key(years, sports, season, country))
+
+
+def filter_key(*values):
+    return tuple(tuple(value) if isinstance(value, list) else value for value in map(normalize, values))
+
+
+@lru_cache(maxsize=32)
+def _filtered_rows(index, years, sports, season, country):
+    # The index is part of the key, so rows of replaced data are never returned
+    return index.select(Year=years, Sport=sports, Season=season, Country=country)
+
+
+@lru_cache(maxsize=32)
+def _filtered_view(index, years, sports, season, country):
+    rows = _filtered_rows(index, years, sports, season, country)
+    return index.df if rows is None else index.df.take(rows)
+
+
+def country_participants(data, df, years=None, sports=None, season=None):
+    # Medals summed per country and the distinct participants of the filtered rows per country
+    rows = filtered_rows(data, years, sports, season)
+    df = df.groupby(
+            ["Country", "Country_latitude", "Country_longitude"], as_index= False, observed=True).agg(
+            {"Number of Medals": "sum"})
+    participants = data.participant_index.count(rows, "Country")
+    df.insert(3, "Participants", participants[df["Country"].cat.codes])
+    return df
+
+
+def basemap_layers(source):
+    # Raster layer of the basemap tiles, fetched through the tile route of the app instead of from the tile server
+    return [{
+        "below": 'traces',
+        "sourcetype": "raster",
+        "sourceattribution": TILE_SOURCES[source]["attribution"],
+        "source": [app.get_relative_path(f"/tiles/{source}/{{z}}/{{x}}/{{y}}")],
+    }]
+
+
+def sunburst_frame(df):
+    # Plotly Express groups the sunburst path with observed=False, which would add an empty
+    # sector for every unused category, so the categorical columns are passed as plain strings
+    return df.astype({column: str for column in df.columns if isinstance(df[column].dtype, pd.CategoricalDtype)})
+
+
+# Figure one; Sunburst graph sorted by number of medals per country per sport/year
+@metrics.timed("figure_one")
+@figure_cache.cached("figure_one")
 def figure_one(years, sports, season, sort):
-    df = grouped_final_athlete_events.sort_values(by="Number of Medals", ascending=False, ignore_index=True)
-    if years:
-        df = df.query("Year == @years")
-    if sports:
-        df = df.query("Sport == @sports")
-    if season:
-        df = df.query("Season == @season")
-    if sort == "Sport":
-        fig = px.sunburst(df.head(100), values='Number of Medals', path=['Sport', 'Country'], title= "Medals and sports for all countries")
-    else: # Default value is now by Country
-        fig = px.sunburst(df.head(100), values='Number of Medals', path=['Country', 'Sport'], title= "Medals and sports for all countries")
+    with metrics.phase("figure_one", "filter"):
+        # The indexed dataframe is already sorted by number of medals
+        df = sunburst_frame(filtered_view(current_data, years, sports, season).head(100))
+    with metrics.phase("figure_one", "figure"):
+        if sort == "Sport":
+            fig = px.sunburst(df, values='Number of Medals', path=['Sport', 'Country'], title= "Medals and sports for all countries")
+        else: # Default value is now by Country
+            fig = px.sunburst(df, values='Number of Medals', path=['Country', 'Sport'], title= "Medals and sports for all countries")
     return fig
 
-# Figure two; Sunburst graph sorted by number of medals per sport/year for SWEDEN
-@callback(
-    Output("graph_sweden_sunburst", "figure"),
-    Input("year_dropdown", "value"),
-    Input("sport_dropdown", "value"),
-    Input("season_dropdown", "value"),
-    Input("sport_or_medal_dropdown", "value"),
-)
-def figure_two(years, sports, season, sort):
-    df = grouped_final_athlete_events.query("Country == 'Sweden'")
-    if years:
-        df = df.query("Year == @years")
-    if sports:
-        df = df.query("Sport == @sports")
-    if season:
-        df = df.query("Season == @season")
-   
-    if sort == "Sports":
-        fig = px.sunburst(df, 
-                          values='Number of Medals', 
-                          path=['Sport', 'Medal'],
-                          color_discrete_sequence=px.colors.qualitative.Pastel1, 
-                          title = "Medals and sports for team SWEDEN")
-    else:   # Default value is now by Medal
+# Figure two; Sunburst graph sorted by number of medals per sport/year for the chosen country, Sweden by default
+@metrics.timed("figure_two")
+@figure_cache.cached("figure_two")
+def figure_two(years, sports, season, sort, country="Sweden"):
+    with metrics.phase("figure_two", "filter"):
+        df = sunburst_frame(filtered_view(current_data, years, sports, season, country))
+
+    with metrics.phase("figure_two", "figure"):
+        if sort == "Sports":
             fig = px.sunburst(df, 
                               values='Number of Medals', 
-                              path=['Medal', 'Sport'],
+                              path=['Sport', 'Medal'],
                               color_discrete_sequence=px.colors.qualitative.Pastel1, 
-                              title = "Medals and sports for team SWEDEN")
+                              title = f"Medals and sports for team {country.upper()}")
+        else:   # Default value is now by Medal
+                fig = px.sunburst(df, 
+                                  values='Number of Medals', 
+                                  path=['Medal', 'Sport'],
+                                  color_discrete_sequence=px.colors.qualitative.Pastel1, 
+                                  title = f"Medals and sports for team {country.upper()}")
     return fig
 
-# Figure three: Bar graph showing top 10 sports with the most medals in Sweden
-@callback(
-    Output("graph_sweden_top10", "figure"),
-    [
-        Input('year_dropdown', 'value'),
-        Input('sport_dropdown', 'value'),
-        Input('season_dropdown', 'value'),
-    ]
-)
-def figure_three(years, sports, season):
-    # Filter the data based on the selected values
-    df = grouped_final_athlete_events.query("Country == 'Sweden'")
-
-    if years:
-        df = df.query("Year == @years")
-    if sports:
-        df = df.query("Sport == @sports")
-    if season:
-        df = df.query("Season == @season")
-
-    # Grouping by sport and counting medals
-    medals_per_sport = df[df['Number of Medals'] > 0].groupby("Sport", as_index=False)["Number of Medals"].count()
-    
-    # Sort values on number of medals in descending order, resetting index and displaying the result in a plot.
-    fig = px.bar(
-        data_frame=medals_per_sport.sort_values(by='Number of Medals', ascending=False, ignore_index=True).head(10),
-        x='Sport',
-        y='Number of Medals',
-        labels={'Number of Medals': 'Number of Medals'},
-        template='plotly_white',
-        title="Top 10 Sports with the Most Medals",
-        barmode='overlay',
-    )
-    fig.update_xaxes(tickangle=45)
+# Figure three: Bar graph showing top 10 sports with the most medals of the chosen country
+@metrics.timed("figure_three")
+@figure_cache.cached("figure_three")
+def figure_three(years, sports, season, country="Sweden"):
+    with metrics.phase("figure_three", "aggregate"):
+        # Counting the medals per sport of the country in the selected years, sports and seasons
+        top_sports = current_data.ranking_index.top_sports(country, years, sports, season)
+
+    with metrics.phase("figure_three", "figure"):
+        # Displaying the result in a plot
+        fig = px.bar(
+            data_frame=top_sports,
+            x='Sport',
+            y='Number of Medals',
+            labels={'Number of Medals': 'Number of Medals'},
+            template='plotly_white',
+            title="Top 10 Sports with the Most Medals",
+            barmode='overlay',
+        )
+        fig.update_xaxes(tickangle=45)
 
     return fig
 
 
-#Figure four: Bar graph showing top 10 sports with the most gold medals in Sweden
-@callback(
-    Output("graph_sweden_gold", "figure"),
-    [
-        Input('year_dropdown', 'value'),
-        Input('sport_dropdown', 'value'),
-        Input('season_dropdown', 'value'),
-
-    ]
-)
-def figure_four(years, sports, season):
-    # Filter the data based on the selected values
-    df = grouped_final_athlete_events.query("Country == 'Sweden'")
-    if years:
-        df = df.query("Year == @years")
-    if sports:
-        df = df.query("Sport == @sports")
-    if season:
-        df = df.query("Season == @season")
-# filtered_data[filtered_data['Year'].isin(year)]
-    # Grouping by sport and counting medals
-    medals_per_sport = df[df['Number of Medals'] > 0].groupby(["Sport", "Medal"], as_index=False)["Number of Medals"].count()
-
-     # Filter to include only Gold medals
-    medals_per_sport = medals_per_sport[medals_per_sport['Medal'].isin(['Gold'])]
-    
-    # Sort values on the number of medals in descending order, resetting index and displaying the result in a plot.
-    fig = px.bar(
-        data_frame=medals_per_sport.sort_values(by='Number of Medals', ascending=False, ignore_index=True).head(10),
-        x='Sport',
-        y='Number of Medals',
-        labels={'Number of Medals': 'Number of Medals'},
-        title="Top 10 Sports Gold Medals",
-        barmode='group',
-    )
-    fig.update_xaxes(tickangle=45)
+#Figure four: Bar graph showing top 10 sports with the most gold medals of the chosen country
+@metrics.timed("figure_four")
+@figure_cache.cached("figure_four")
+def figure_four(years, sports, season, country="Sweden"):
+    with metrics.phase("figure_four", "aggregate"):
+        # Counting only the gold medals per sport of the country
+        top_sports = current_data.ranking_index.top_sports(country, years, sports, season, medal="Gold")
+
+    with metrics.phase("figure_four", "figure"):
+        # Displaying the result in a plot
+        fig = px.bar(
+            data_frame=top_sports,
+            x='Sport',
+            y='Number of Medals',
+            labels={'Number of Medals': 'Number of Medals'},
+            title="Top 10 Sports Gold Medals",
+            barmode='group',
+        )
+        fig.update_xaxes(tickangle=45)
 
     return fig   
 
 # Figure five: Mapbox graph showing participants and medals per country/year and season by choice
-@callback(
-Output("graph_mapbox_2", "figure"),
-Input("year_dropdown", "value"),
-Input("sport_dropdown", "value"),
-Input("season_dropdown", "value")
-)
+@metrics.timed("figure_five")
+@figure_cache.cached("figure_five")
 def figure_five(years, sports, sort):
-    if sort:
-        if (years in [None, "", []]) and (sports in [None, "", []]):
-            df = grouped_final_athlete_events.drop(columns=["Year","Sport","Medal"])
-            df = df.query("Season == @sort").groupby(
-                    ["Country", "Country_latitude", "Country_longitude"], as_index= False).agg(
-                    {"Participants": "sum", "Number of Medals": "sum"})
-        elif years not in [None, "", []] and sports in [None, "", []]:
-            df = grouped_final_athlete_events.drop(columns=["Sport","Medal"]).query("Year==@years")
-            df = df.query("Season == @sort").groupby(
-                    ["Country", "Country_latitude", "Country_longitude"], as_index= False).agg(
-                    {"Participants": "sum", "Number of Medals": "sum"})
-        elif years in [None, "", []] and sports not in [None, "", []]:
-            df = grouped_final_athlete_events.drop(columns=["Year","Medal"]).query("Sport==@sports")
-            df  = df.query("Season == @sort").groupby(
-                    ["Country", "Country_latitude", "Country_longitude"], as_index= False).agg(
-                    {"Participants": "sum", "Number of Medals": "sum"})
-        elif years not in [None, "", []] and sports not in [None, "", []]:
-            df = grouped_final_athlete_events.drop(columns=["Medal"]).query("Year==@years")
-            df = df.query("Sport==@sports")
-            df  = df.query("Season == @sort").groupby(
-                    ["Country", "Country_latitude", "Country_longitude"], as_index= False).agg(
-                    {"Participants": "sum", "Number of Medals": "sum"})  
-    else:
-        if (years in [None, "", []]) and (sports in [None, "", []]):
-            df = grouped_final_athlete_events.drop(columns=["Year","Sport","Season", "Medal"]).groupby(
-                    ["Country", "Country_latitude", "Country_longitude"], as_index= False).agg(
-                    {"Participants": "sum", "Number of Medals": "sum"})
-        elif years not in [None, "", []] and sports in [None, "", []]:
-            df = grouped_final_athlete_events.drop(columns=["Sport","Season","Medal"]).query("Year==@years").groupby(
-                    ["Country", "Country_latitude", "Country_longitude"], as_index= False).agg(
-                    {"Participants": "sum", "Number of Medals": "sum"})
-        elif years in [None, "", []] and sports not in [None, "", []]:
-            df = grouped_final_athlete_events.drop(columns=["Year","Season","Medal"]).query("Sport==@sports").groupby(
-                    ["Country", "Country_latitude", "Country_longitude"], as_index= False).agg(
-                    {"Participants": "sum", "Number of Medals": "sum"})
-        elif years not in [None, "", []] and sports not in [None, "", []]:
-            df = grouped_final_athlete_events.drop(columns= ["Season","Medal"]).query("Year==@years")
-            df = df.query("Sport==@sports").groupby(
-                    ["Country", "Country_latitude", "Country_longitude"], as_index= False).agg(
-                    {"Participants": "sum", "Number of Medals": "sum"})     
-
-    fig = px.scatter_mapbox(df, lat="Country_latitude", 
-        lon="Country_longitude", size="Participants", color="Number of Medals", 
-        hover_name="Country",  mapbox_style="open-street-map",
-        center=dict(lat=0, lon=0), zoom=1, 
-        title="Size according to count of participants and Season")    
-    fig.update_mapboxes(bounds_east=180, bounds_west=-180, bounds_north=90, bounds_south=-90)
-    fig.update_layout(                       
-        mapbox_style="white-bg",
-        mapbox_layers=[
-        {
-        "below": 'traces',
-        "sourcetype": "raster",
-        "sourceattribution": "United States Geological Survey",
-        "source": [
-        "https://basemap.nationalmap.gov/arcgis/rest/services/USGSImageryOnly/MapServer/tile/{z}/{y}/{x}"
-        ]
-        }
-        ])
+    data = current_data
+    with metrics.phase("figure_five", "filter"):
+        # Season is only filtered on when chosen, the other filters likewise
+        df = filtered_view(data, years, sports, sort)
+    with metrics.phase("figure_five", "aggregate"):
+        # Without any filter the view is the whole dataframe, which is already summed up per country
+        df = data.country_rollups if df is data.grouped_final_athlete_events else country_participants(data, df, years, sports, sort)
+
+    with metrics.phase("figure_five", "figure"):
+        fig = px.scatter_mapbox(df, lat="Country_latitude", 
+            lon="Country_longitude", size="Participants", color="Number of Medals", 
+            hover_name="Country",  mapbox_style="open-street-map",
+            center=dict(lat=0, lon=0), zoom=1, 
+            title="Size according to count of participants and Season")    
+        fig.update_mapboxes(bounds_east=180, bounds_west=-180, bounds_north=90, bounds_south=-90)
+        fig.update_layout(                       
+            mapbox_style="white-bg",
+            mapbox_layers=basemap_layers("usgs"))
     return fig
 
 
 # Figure six: Mapbox graph with participants and medals per country/year/sport, and dropdown alternative to see gender ratios per country/year/sport
-@callback(
-    Output("graph_gender_or_medals_mapbox", "figure"),
-    Input("year_dropdown", "value"),
-    Input("sport_dropdown", "value"),
-    Input("country_dropdown_left", "value")
-)
-def figure_six(years, sports, sort):
-    if sort == "Medals" or sort in [None, "", []]:
-        if (years in [None, "", []]) and (sports in [None, "", []]):
-            df = grouped_final_athlete_events.drop(columns=["Year","Sport","Season","Medal"]).groupby(
-                    ["Country", "Country_latitude", "Country_longitude"], as_index= False).agg(
-                    {"Participants": "sum", "Number of Medals": "sum"})
-        elif years not in [None, "", []] and sports in [None, "", []]:
-            df = (grouped_final_athlete_events.drop(columns=["Sport","Season","Medal"])
-                  .query("Year==@years")
-                  .groupby(
-                    ["Country", "Country_latitude", "Country_longitude"], as_index= False).agg(
-                    {"Participants": "sum", "Number of Medals": "sum"})
-                  )
-        elif years in [None, "", []] and sports not in [None, "", []]:
-            df = (grouped_final_athlete_events.drop(columns=["Year","Season","Medal"])
-                  .query("Sport==@sports")
-                  .groupby(
-                    ["Country", "Country_latitude", "Country_longitude"], as_index= False).agg(
-                    {"Participants": "sum", "Number of Medals": "sum"})
-                  )
-        elif years not in [None, "", []] and sports not in [None, "", []]:
-            df = grouped_final_athlete_events.drop(columns= ["Season","Medal"]).query("Year==@years")
-            df = (df.query("Sport==@sports")
-                .groupby(
-                ["Country", "Country_latitude", "Country_longitude"], as_index= False).agg(
-                {"Participants": "sum", "Number of Medals": "sum"})
-            )
-
-    elif sort =="Gender ratio":
-        df = gender_ratios
-        fig = px.scatter_mapbox(df, animation_frame = "Year", lat="Country_latitude",
+@metrics.timed("figure_six")
+def figure_six(years, sports, sort, gender_year=None):
+    if sort =="Gender ratio":
+        return gender_ratio_map(gender_year)
+    return medals_map(years, sports)
+
+
+@figure_cache.cached("figure_six_medals")
+def medals_map(years, sports):
+    data = current_data
+    with metrics.phase("figure_six", "filter"):
+        df = filtered_view(data, years, sports)
+    with metrics.phase("figure_six", "aggregate"):
+        # Without any filter the view is the whole dataframe, which is already summed up per country
+        df = data.country_rollups if df is data.grouped_final_athlete_events else country_participants(data, df, years, sports)
+
+    with metrics.phase("figure_six", "figure"):
+        fig = px.scatter_mapbox(df, lat="Country_latitude", lon="Country_longitude", size="Participants", color="Number of Medals", 
+                        hover_name="Country",  mapbox_style="open-street-map", 
+                        center=dict(lat=0, lon=0), zoom=1.2, opacity=0.5,
+                        title="Size according to count of participants")
+        
+        fig.update_mapboxes(bounds_east=180, bounds_west=-180, bounds_north=90, bounds_south=-90)
+        # The open-street-map style with its tiles from the tile route
+        fig.update_layout(mapbox_style="white-bg", mapbox_layers=basemap_layers("osm"))
+    return fig
+
+
+# Gender ratios of a single year, the year slider fetches the other years when they are chosen
+# instead of sending the frames of all years at once
+@figure_cache.cached("figure_six_gender_ratio")
+def gender_ratio_map(year):
+    gender_ratios, gender_ratio_years = current_data.gender_ratios, current_data.gender_ratio_years
+    if year not in gender_ratio_years:
+        year = min(gender_ratio_years)
+    with metrics.phase("figure_six", "figure"):
+        fig = px.scatter_mapbox(gender_ratio_years[year], lat="Country_latitude",
                 lon="Country_longitude", size="Count", color="Ratio", 
                 hover_name="Country",  mapbox_style="open-street-map", 
-                center=dict(lat=0, lon=0), zoom=1, title="Gender ratios over the years")
-        return fig
-    
-    fig = px.scatter_mapbox(df, lat="Country_latitude", lon="Country_longitude", size="Participants", color="Number of Medals", 
-                    hover_name="Country",  mapbox_style="open-street-map", 
-                    center=dict(lat=0, lon=0), zoom=1.2, opacity=0.5,
-                    title="Size according to count of participants")
-    
-    fig.update_mapboxes(bounds_east=180, bounds_west=-180, bounds_north=90, bounds_south=-90)
+                center=dict(lat=0, lon=0), zoom=1, title=f"Gender ratios over the years: {year}",
+                # The same color and size scales for every year, like in an animation over all years
+                range_color=[gender_ratios["Ratio"].min(), gender_ratios["Ratio"].max()])
+        fig.update_traces(marker_sizeref=2.0 * gender_ratios["Count"].max() / 20 ** 2)
+        fig.update_layout(mapbox_style="white-bg", mapbox_layers=basemap_layers("osm"))
     return fig
 
 
+############ Callback Decorater to update the figures ############ 
+
+# The graph of every figure and the dropdowns it is built from, in the order of its arguments
+FIGURES = {
+    "graph_all_countries_sunburst": (figure_one, ["year_dropdown", "sport_dropdown", "season_dropdown", "country_dropdown_right"]),
+    "graph_sweden_sunburst": (figure_two, ["year_dropdown", "sport_dropdown", "season_dropdown", "sport_or_medal_dropdown", "country_dropdown"]),
+    "graph_sweden_top10": (figure_three, ["year_dropdown", "sport_dropdown", "season_dropdown", "country_dropdown"]),
+    "graph_sweden_gold": (figure_four, ["year_dropdown", "sport_dropdown", "season_dropdown", "country_dropdown"]),
+    "graph_mapbox_2": (figure_five, ["year_dropdown", "sport_dropdown", "season_dropdown"]),
+    "graph_gender_or_medals_mapbox": (figure_six, ["year_dropdown", "sport_dropdown", "country_dropdown_left", "gender_year_slider"]),
+}
+
+# Values of the dropdowns when the page is loaded, the year slider is only used by the gender ratios
+DEFAULT_VALUES = {
+    "year_dropdown": None,
+    "sport_dropdown": None,
+    "season_dropdown": None,
+    "country_dropdown": "Sweden",
+    "country_dropdown_right": "Country",
+    "sport_or_medal_dropdown": "Medals",
+    "country_dropdown_left": None,
+    "gender_year_slider": None,
+}
+
+@lru_cache(maxsize=1)
+def default_figures(data_version):
+    # Built once per version of the data, at startup and after a reload, instead of by the callbacks of every visitor
+    return {
+        graph: figure(*(DEFAULT_VALUES[dropdown] for dropdown in dropdowns))
+        for graph, (figure, dropdowns) in FIGURES.items()
+    }
+
+# Built before gunicorn forks the workers with --preload, so every worker starts with them
+default_figures(current_data.version)
+# Every forked worker would count the timings and cache misses of building them again
+metrics.reset()
+figure_cache.reset_stats()
+
+# Set after the default figures, as Dash builds the layout once to check it
+app.layout = serve_layout
+
+# The headers follow the chosen country
+app.clientside_callback(
+    """function (country) {
+        return [`Medals ${country}`, `${country} top 10 all Medals`, `${country} top 10 Gold Medals`];
+    }""",
+    Output("header_graph_sweden", "children"),
+    Output("header_graph_sweden_top10", "children"),
+    Output("header_graph_sweden_gold", "children"),
+    Input("country_dropdown", "value"),
+    prevent_initial_call=True,
+)
+
+# The year controls of the gender ratio map are only shown for the gender ratios
+app.clientside_callback(
+    """function (sort) {
+        return {display: sort === "Gender ratio" ? "flex" : "none", gap: "1rem", alignItems: "center"};
+    }""",
+    Output("gender_year_controls", "style"),
+    Input("country_dropdown_left", "value"),
+)
+
+# Play and pause the years of the gender ratio map
+app.clientside_callback(
+    """function (n_clicks, disabled) {
+        return [!disabled, disabled ? "Pause" : "Play"];
+    }""",
+    Output("gender_play_interval", "disabled"),
+    Output("gender_play_button", "children"),
+    Input("gender_play_button", "n_clicks"),
+    State("gender_play_interval", "disabled"),
+    prevent_initial_call=True,
+)
+
+# While playing the slider moves to the next year every second, and back to the first year after the last
+app.clientside_callback(
+    """function (n_intervals, year, marks) {
+        const years = Object.keys(marks).map(Number).sort((a, b) => a - b);
+        return years[(years.indexOf(year) + 1) % years.length];
+    }""",
+    Output("gender_year_slider", "value"),
+    Input("gender_play_interval", "n_intervals"),
+    State("gender_year_slider", "value"),
+    State("gender_year_slider", "marks"),
+    prevent_initial_call=True,
+)
+
+# In client-side mode the browser builds these figures itself from the events store
+if CLIENTSIDE_FILTERING:
+    app.clientside_callback(
+        ClientsideFunction(namespace="olympics", function_name="update_figures"),
+        [Output(graph, "figure") for graph in CLIENTSIDE_FIGURES],
+        Input("events_store", "data"),
+        Input("year_dropdown", "value"),
+        Input("sport_dropdown", "value"),
+        Input("season_dropdown", "value"),
+        Input("country_dropdown_right", "value"),
+        Input("sport_or_medal_dropdown", "value"),
+        Input("country_dropdown", "value"),
+        # The first figures are in the layout already
+        prevent_initial_call=True,
+    )
+
+server_figures = {graph: figure for graph, figure in FIGURES.items()
+                  if not (CLIENTSIDE_FILTERING and graph in CLIENTSIDE_FIGURES)
+                  and not (BACKGROUND_CALLBACKS and graph in BACKGROUND_FIGURES)}
+server_inputs = list(dict.fromkeys(dropdown for _, dropdowns in server_figures.values() for dropdown in dropdowns))
+
+# One callback for all figures, so every interaction is a single request and a single filter pass.
+# The figures of the first page load come with the layout, so the callback only runs for changed dropdowns
+def update_figures(*values):
+    value_of = dict(zip(server_inputs, values))
+    triggered = set(ctx.triggered_prop_ids.values())
+    start = time.perf_counter()
+    figures = [
+        figure(*(value_of[dropdown] for dropdown in dropdowns))
+        if triggered.intersection(dropdowns) else no_update
+        for figure, dropdowns in server_figures.values()
+    ]
+    g.callback_seconds = time.perf_counter() - start
+    return figures
+
+# With CLIENTSIDE_FILTERING=1 and BACKGROUND_CALLBACKS=1 no figure is left for it, and Dash needs inputs for a callback
+if server_figures:
+    callback(
+        [Output(graph, "figure") for graph in server_figures],
+        [Input(dropdown, "value") for dropdown in server_inputs],
+        prevent_initial_call=True,
+    )(update_figures)
+
+# In background mode every map has its own callback, so a job only depends on the dropdowns of its map
+# and the job of the same dropdowns and data version can be shared between sessions
+if BACKGROUND_CALLBACKS:
+    background_manager = SharedJobManager(
+        os.environ.get("BACKGROUND_CACHE_DIR", os.path.join(CACHE_DIR, "background")),
+        # Jobs are keyed on the source of the callback, which does not change with the figure code of the maps
+        cache_by=[lambda: current_data.version, lambda: FIGURES_VERSION],
+    )
+    for graph in BACKGROUND_FIGURES:
+        figure, dropdowns = FIGURES[graph]
+        callback(
+            Output(graph, "figure"),
+            [Input(dropdown, "value") for dropdown in dropdowns],
+            background=True,
+            manager=background_manager,
+            interval=500,
+            prevent_initial_call=True,
+        )(figure)
+
+
+############ Metrics of the callbacks ############ 
+
+@server.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+def figure_cache_counters():
+    cache_stats = figure_cache.stats()
+    return [
+        ("figure_cache_hits_total", {}, cache_stats["hits"]),
+        ("figure_cache_misses_total", {}, cache_stats["misses"]),
+    ]
+
+@server.after_request
+def measure_callback_response(response):
+    if request.path.endswith("/_dash-update-component") and "callback_seconds" in g:
+        # What is left of the request besides the callback is mostly the serialization of the figures to JSON
+        metrics.observe_phase("update_figures", "serialize",
+                              time.perf_counter() - g.request_start - g.callback_seconds)
+        # Measured before flask-compress, which runs after this hook, so these are the bytes of the JSON
+        metrics.increment("callback_response_uncompressed_bytes_total", response.calculate_content_length() or 0)
+    # The metrics this request changed are shared with the other workers
+    metrics.flush(figure_cache_counters())
+    return response
+
+# Basemap tiles of the maps from the tile cache. A tile that is not cached yet is fetched in the background,
+# and meanwhile the browser is sent to the tile server, so the workers never wait for the tile servers
+@server.route("/tiles/<source>/<int:z>/<int:x>/<int:y>")
+def tile_route(source, z, x, y):
+    if not tile_cache.valid(source, z, x, y):
+        return Response(status=404)
+    tile = tile_cache.get(source, z, x, y)
+    if tile is None:
+        if tile_cache.offline:
+            return Response(status=404)
+        return redirect(tile_cache.url(source, z, x, y))
+    data, content_type = tile
+    # Tiles hardly ever change, so browsers keep them for a day
+    return Response(data, mimetype=content_type, headers={"Cache-Control": "public, max-age=86400"})
+
+############ Export of the data behind the graphs ############ 
+
+# Exports running at the same time over all workers, further exports get a 429 so the graphs stay responsive
+EXPORT_CONCURRENCY = int(os.environ.get("EXPORT_CONCURRENCY", "1"))
+export_slots = ExportSlots(os.path.join(CACHE_DIR, "exports"), EXPORT_CONCURRENCY)
+
+# The datasets of the export route and the columns they can be filtered on
+EXPORT_DATASETS = {
+    "grouped_final_athlete_events": ("Year", "Season", "Sport", "Country"),
+    "gender_ratios": ("Year", "Country"),
+    "country_rollups": ("Year", "Season", "Sport", "Country"),
+}
+
+def export_rows(dataset, filters):
+    # The same filtering and aggregation as the graphs, so exports show the numbers of the graphs
+    data = current_data
+    years, seasons, sports, countries = (filters.get(column) for column in ["Year", "Season", "Sport", "Country"])
+    if dataset == "grouped_final_athlete_events":
+        df, rows = data.grouped_final_athlete_events, filtered_rows(data, years, sports, seasons, countries)
+    elif dataset == "gender_ratios":
+        df, rows = data.gender_ratios, data.gender_index.select(Year=years, Country=countries)
+    else:
+        # The countries of the maps, with the distinct participants of the filtered rows
+        view = filtered_view(data, years, sports, seasons)
+        df = data.country_rollups if view is data.grouped_final_athlete_events else country_participants(data, view, years, sports, seasons)
+        rows = np.flatnonzero(df["Country"].isin(countries)) if countries else None
+    return df, np.arange(len(df)) if rows is None else rows
+
+# Streams a dataset as CSV, NDJSON or Arrow, e.g. /api/export/grouped_final_athlete_events?year=2012&country=Sweden&format=ndjson
+@server.route("/api/export/<dataset>")
+def export_route(dataset):
+    if dataset not in EXPORT_DATASETS:
+        return Response(f"Unknown dataset, the datasets are {', '.join(EXPORT_DATASETS)}", status=404, mimetype="text/plain")
+    export_format = request.args.get("format", "csv")
+    try:
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown format, the formats are {', '.join(EXPORT_FORMATS)}")
+        if export_format == "arrow":
+            import pyarrow  # noqa: F401 Only needed for the Arrow format
+        filters = parse_filters(request.args, EXPORT_DATASETS[dataset])
+        offset, limit = parse_page(request.args)
+        df, rows = export_rows(dataset, filters)
+        columns = parse_columns(request.args, df.columns)
+    except ImportError:
+        return Response("The arrow format needs pyarrow to be installed", status=501, mimetype="text/plain")
+    except ValueError as error:
+        return Response(str(error), status=400, mimetype="text/plain")
+
+    release_slot = export_slots.acquire()
+    if release_slot is None:
+        return Response("Too many exports at the same time, try again shortly", status=429,
+                        headers={"Retry-After": "5"}, mimetype="text/plain")
+    metrics.increment("export_requests_total", dataset=dataset, format=export_format)
+    total = len(rows)
+    rows = rows[offset:None if limit is None else offset + limit]
+    response = Response(stream_with_context(stream_rows(df, rows, columns, export_format)),
+                        mimetype=EXPORT_FORMATS[export_format], headers={"X-Total-Count": str(total)})
+    if offset + len(rows) < total:
+        next_page = request.args.to_dict(flat=False) | {"offset": [str(offset + len(rows))]}
+        response.headers["Link"] = f'<{request.base_url}?{urlencode(next_page, doseq=True)}>; rel="next"'
+    # The slot is free again when the response is done, also when the client goes away halfway
+    response.call_on_close(release_slot)
+    return response
+
+# Prometheus metrics of all workers
+@server.route("/metrics")
+def metrics_route():
+    text = metrics.render(figure_cache_counters())
+    return Response(text, mimetype="text/plain; version=0.0.4")
+
+
 if __name__ == "__main__":
     app.run(debug=True)
     
\ No newline at end of file
@@ -0,0 +1,31 @@
+from data_store import load_frames
+from filter_index import FilterIndex
+from participant_index import ParticipantIndex
+from ranking_index import RankingIndex
+
+
+class AppData:
+    """One version of the prepared dataframes together with the indexes built from them.
+
+    The app keeps the current AppData in a single global and replaces it as a whole on a reload, so a
+    request that took it once never mixes the frames of one version with the indexes of another.
+    """
+
+    def __init__(self, version):
+        self.version = version
+        # Load the prepared dataframes for the app, from the columnar cache unless the source CSV files have changed
+        frames = load_frames(version)
+        self.grouped_final_athlete_events = frames["grouped_final_athlete_events"]
+        self.gender_ratios = frames["gender_ratios"]
+        # Participants and medals per country over all Games, the maps without any filter
+        self.country_rollups = frames["country_rollups"]
+        # The gender ratio map shows one year at a time, so the rows of every year are split up once
+        self.gender_ratio_years = {year: df for year, df in self.gender_ratios.groupby("Year")}
+        # Index of row positions per Year, Season, Sport and Country used by all callbacks to filter the dataframe
+        self.events_index = FilterIndex(self.grouped_final_athlete_events)
+        # Athlete IDs of every grouped row, so the maps count every participant once however the rows are combined
+        self.participant_index = ParticipantIndex(self.grouped_final_athlete_events, frames["participant_ids"]["ID"])
+        # Top sports of every country, for the bar graphs of the chosen country
+        self.ranking_index = RankingIndex(self.grouped_final_athlete_events)
+        # Row positions of the gender ratios per year and country, for the export route
+        self.gender_index = FilterIndex(self.gender_ratios, columns=("Year", "Country"))
@@ -0,0 +1,133 @@
+// Figures built in the browser in client-side mode (CLIENTSIDE_FILTERING=1).
+// They mirror figure_one to figure_four in app.py, using the events store made by clientside.py.
+
+// The value of a column for a row of the store
+function eventValue(store, column, row) {
+    const encoded = store.columns[column];
+    return encoded.values[encoded.codes[row]];
+}
+
+// Rows of the store matching the selected values of every dropdown, in the order of the store
+function filterEvents(store, filters) {
+    const active = [];
+    Object.entries(filters).forEach(([column, selected]) => {
+        // An empty dropdown does not filter
+        if (!selected || selected.length === 0) {
+            return;
+        }
+        const wanted = new Set(Array.isArray(selected) ? selected : [selected]);
+        const codes = new Set();
+        store.columns[column].values.forEach((value, code) => {
+            if (wanted.has(value)) {
+                codes.add(code);
+            }
+        });
+        active.push([store.columns[column].codes, codes]);
+    });
+
+    const rows = [];
+    for (let row = 0; row < store.medals.length; row++) {
+        if (active.every(([codes, wanted]) => wanted.has(codes[row]))) {
+            rows.push(row);
+        }
+    }
+    return rows;
+}
+
+// Same figure as px.sunburst with a path of two columns and the number of medals as values
+function medalSunburst(store, rows, path, title, extraLayout) {
+    const sectors = new Map();
+    const add = (id, label, parent, medals) => {
+        const sector = sectors.get(id) || {label: label, parent: parent, value: 0};
+        sector.value += medals;
+        sectors.set(id, sector);
+    };
+    rows.forEach(row => {
+        const outer = String(eventValue(store, path[0], row));
+        const inner = String(eventValue(store, path[1], row));
+        add(outer + "/" + inner, inner, outer, store.medals[row]);
+        add(outer, outer, "", store.medals[row]);
+    });
+
+    const ids = Array.from(sectors.keys());
+    return {
+        data: [{
+            type: "sunburst",
+            branchvalues: "total",
+            ids: ids,
+            labels: ids.map(id => sectors.get(id).label),
+            parents: ids.map(id => sectors.get(id).parent),
+            values: ids.map(id => sectors.get(id).value),
+            hovertemplate: "labels=%{label}<br>Number of Medals=%{value}<br>parent=%{parent}<br>id=%{id}<extra></extra>",
+            domain: {x: [0, 1], y: [0, 1]},
+        }],
+        layout: Object.assign({
+            template: store.templates.default,
+            title: {text: title},
+            legend: {tracegroupgap: 0},
+        }, extraLayout),
+    };
+}
+
+// Same figure as the px.bar of the ten sports with the most medal rows
+function topSportsBar(store, rows, medal, title, template, barmode) {
+    const counts = new Map();
+    rows.forEach(row => {
+        if (medal === null || eventValue(store, "Medal", row) === medal) {
+            const sport = eventValue(store, "Sport", row);
+            counts.set(sport, (counts.get(sport) || 0) + 1);
+        }
+    });
+    const top = Array.from(counts)
+        .sort((a, b) => b[1] - a[1] || (a[0] < b[0] ? -1 : 1))
+        .slice(0, 10);
+
+    return {
+        data: [{
+            type: "bar",
+            x: top.map(sport => sport[0]),
+            y: top.map(sport => sport[1]),
+            orientation: "v",
+            textposition: "auto",
+            // Plotly Express takes the first color of the template and makes overlaid bars transparent
+            marker: Object.assign({color: template.layout.colorway[0]}, barmode === "overlay" ? {opacity: 0.5} : {}),
+            hovertemplate: "Sport=%{x}<br>Number of Medals=%{y}<extra></extra>",
+        }],
+        layout: {
+            template: template,
+            title: {text: title},
+            barmode: barmode,
+            xaxis: {title: {text: "Sport"}, tickangle: 45},
+            yaxis: {title: {text: "Number of Medals"}},
+            legend: {tracegroupgap: 0},
+        },
+    };
+}
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    olympics: {
+        update_figures: function (store, years, sports, season, sortAllCountries, sortCountry, country) {
+            if (!store) {
+                return Array(4).fill(window.dash_clientside.no_update);
+            }
+            const rows = filterEvents(store, {Year: years, Sport: sports, Season: season});
+            const countryRows = filterEvents(store, {Year: years, Sport: sports, Season: season, Country: [country]});
+
+            const figureOne = medalSunburst(
+                store, rows.slice(0, 100),
+                sortAllCountries === "Sport" ? ["Sport", "Country"] : ["Country", "Sport"],
+                "Medals and sports for all countries", {});
+            const figureTwo = medalSunburst(
+                store, countryRows,
+                sortCountry === "Sports" ? ["Sport", "Medal"] : ["Medal", "Sport"],
+                "Medals and sports for team " + country.toUpperCase(), {sunburstcolorway: store.colors.Pastel1});
+            const figureThree = topSportsBar(
+                store, countryRows, null, "Top 10 Sports with the Most Medals",
+                store.templates.plotly_white, "overlay");
+            const figureFour = topSportsBar(
+                store, countryRows, "Gold", "Top 10 Sports Gold Medals",
+                store.templates.default, "group");
+            return [figureOne, figureTwo, figureThree, figureFour];
+        },
+    },
+});
@@ -0,0 +1,50 @@
+from dash import DiskcacheManager
+
+from figure_cache import normalize
+
+
+class SharedJobManager(DiskcacheManager):
+    """Background callbacks in local processes with their results on disk, shared by all sessions.
+
+    A job with the same callback, inputs and data version as a running job is not started again,
+    the new request waits for the running one. The inputs are normalized like the keys of the figure
+    cache, so e.g. the years [2016, 2012] and [2012, 2016] share a job. Finished results are kept for
+    `expire` seconds, so later identical requests get them without a new job.
+
+    Dash stops the running job of a session when the same callback is triggered again (the oldJob
+    of the request). A shared job is only stopped when no other session is still waiting for it.
+    """
+
+    def __init__(self, directory, cache_by, expire=600):
+        import diskcache  # Only needed with background callbacks
+
+        super().__init__(diskcache.Cache(directory), cache_by=cache_by, expire=expire)
+
+    def build_cache_key(self, fn, args, cache_args_to_ignore):
+        if isinstance(args, dict):
+            args = {name: normalize(value) for name, value in args.items()}
+        else:
+            args = [normalize(value) for value in args]
+        return super().build_cache_key(fn, args, cache_args_to_ignore)
+
+    def call_job_fn(self, key, job_fn, args, context):
+        with self.handle.transact():
+            # Finished before, the result is read on the first poll. 0 is never a job process
+            if self.result_ready(key):
+                return 0
+            job = self.handle.get(f"job-{key}")
+            if job and self.job_running(job):
+                self.handle.incr(f"waiters-{job}")
+                return job
+            job = super().call_job_fn(key, job_fn, args, context)
+            self.handle.set(f"job-{key}", job, expire=self.expire)
+            self.handle.set(f"waiters-{job}", 1, expire=self.expire)
+            return job
+
+    def terminate_job(self, job):
+        if job is None or int(job) == 0:
+            return
+        with self.handle.transact():
+            waiters = self.handle.decr(f"waiters-{int(job)}", default=1)
+        if waiters <= 0:
+            super().terminate_job(job)
@@ -0,0 +1,30 @@
+import pandas as pd
+import plotly.express as px
+import plotly.io as pio
+
+# The graphs built in the browser in client-side mode, see assets/clientside.js
+CLIENTSIDE_FIGURES = ["graph_all_countries_sunburst", "graph_sweden_sunburst", "graph_sweden_top10", "graph_sweden_gold"]
+
+
+def encode_events(df):
+    """Encode the grouped medals compactly for the browser.
+
+    Every column is sent as one integer code per row plus the list of values the codes stand for.
+    Only rows with medals are sent, the others only add empty sectors to the sunbursts and are
+    left out of the bar graphs. The rows keep their order, sorted by number of medals.
+    """
+    df = df[df["Number of Medals"] > 0]
+    columns = {}
+    for column in ["Year", "Season", "Medal", "Country", "Sport"]:
+        codes, values = pd.factorize(df[column], sort=True)
+        columns[column] = {"codes": codes.tolist(), "values": list(values)}
+    return {
+        "columns": columns,
+        "medals": df["Number of Medals"].tolist(),
+        # Templates and colors of the figures built on the server, so both modes look the same
+        "templates": {
+            "default": pio.templates[pio.templates.default].to_plotly_json(),
+            "plotly_white": pio.templates["plotly_white"].to_plotly_json(),
+        },
+        "colors": {"Pastel1": px.colors.qualitative.Pastel1},
+    }
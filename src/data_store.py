@@ -0,0 +1,331 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from participant_index import ParticipantIndex, take_groups
+
+# Folder with the datafiles, independent of the working directory the app is started from
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
+CACHE_DIR = os.path.join(DATA_DIR, "cache")
+# Aggregates of Games added after final_df.csv, written by ingest.py
+INGESTED_DIR = os.path.join(DATA_DIR, "ingested")
+# Prepared dataframes built from the raw athlete events by etl.py, used instead of final_df.csv when present
+PREPARED_DIR = os.path.join(DATA_DIR, "prepared")
+PREPARED_FILES = {
+    "grouped_final_athlete_events": "grouped_final_athlete_events.csv",
+    "gender_ratios": "gender_ratios.csv",
+    "country_rollups": "country_rollups.csv",
+    "participant_ids": "participant_ids.csv",
+}
+
+# Bump when the preparation below or the on-disk layout changes, so old caches are not reused
+CACHE_VERSION = 4
+
+# The CSV files the prepared dataframes are built from, besides the ingested Games
+SOURCE_FILES = ["final_df.csv", "gender_ratios.csv"]
+
+# Columns the medals and participants are grouped by
+GROUP_COLUMNS = ['Year','Season', 'Medal', 'Country', 'Sport', 'Country_latitude', 'Country_longitude']
+GENDER_COLUMNS = ['Year', 'Sex', 'Country', 'Continent','Country_latitude', 'Country_longitude','Continent_latitude', 'Continent_longitude']
+# Columns of the participants and medals per country over all Games
+ROLLUP_COLUMNS = ['Country', 'Country_latitude', 'Country_longitude']
+
+# Narrow numeric types of the prepared dataframes, the string columns are stored as categorical codes
+NUMERIC_DTYPES = {
+    "Year": "int16",
+    "Country_latitude": "float32",
+    "Country_longitude": "float32",
+    "Continent_latitude": "float32",
+    "Continent_longitude": "float32",
+    "Participants": "int32",
+    "Number of Medals": "int32",
+    "Count": "int32",
+    "ID": "int32",
+    "Ratio": "float32",
+}
+
+
+############### Preparation of dataframes for the app ###############
+
+def prepare_frames():
+    """Read the source CSV files and the ingested Games and build the dataframes used by the app."""
+    if has_prepared():
+        frames = read_prepared()
+    else:
+        frames = read_final_df()
+
+    ingested = read_ingested()
+    if ingested["grouped_final_athlete_events"]:
+        # The rollups are built again below to include the ingested Games
+        frames.pop("country_rollups", None)
+    frames["grouped_final_athlete_events"] = pd.concat([frames["grouped_final_athlete_events"]] + ingested["grouped_final_athlete_events"], ignore_index=True)
+    frames["gender_ratios"] = pd.concat([frames["gender_ratios"]] + ingested["gender_ratios"], ignore_index=True)
+    frames["participant_ids"] = pd.concat([frames["participant_ids"]] + ingested["participant_ids"], ignore_index=True)
+    return finish_frames(frames)
+
+
+def read_final_df():
+    """Aggregate final_df.csv and read gender_ratios.csv, as made by the cells of assignment_2.ipynb."""
+    # Only the columns needed for the app are read, with the strings as categories to keep the raw events small
+    athlete_events = pd.read_csv(
+        os.path.join(DATA_DIR, "final_df.csv"),
+        usecols=GROUP_COLUMNS + ['Participants'],
+        dtype={'Season': 'category', 'Country': 'category', 'Sport': 'category'},
+        low_memory=False)
+    grouped_final_athlete_events, participant_ids = aggregate_events(athlete_events)
+    # The event level rows are not needed anymore once aggregated
+    del athlete_events
+
+    gender_ratios = pd.read_csv(os.path.join(DATA_DIR, "gender_ratios.csv"), index_col=0)
+    return {"grouped_final_athlete_events": grouped_final_athlete_events, "gender_ratios": gender_ratios,
+            "participant_ids": participant_ids}
+
+
+def has_prepared():
+    """Whether etl.py has written all prepared dataframes."""
+    return all(os.path.exists(os.path.join(PREPARED_DIR, name)) for name in PREPARED_FILES.values())
+
+
+def read_prepared():
+    """Read the dataframes written by etl.py."""
+    return {name: pd.read_csv(os.path.join(PREPARED_DIR, filename)) for name, filename in PREPARED_FILES.items()}
+
+
+def aggregate_events(athlete_events):
+    """Group athlete events to the number of participants and medals per GROUP_COLUMNS.
+
+    Returns the grouped medals and the athlete IDs of every grouped row, one row after the other,
+    with as many IDs per row as it has Participants.
+    """
+    # Changing the NaN values in the Medal column to "No Medal"
+    medal = athlete_events['Medal'].astype(object).fillna('No Medal')
+    athlete_events = athlete_events.assign(
+        Medal=medal,
+        # Creating column Number of Medals and mapping the Medal column to values of 1 for medal and 0 for NaN value
+        **{'Number of Medals': medal.map({'Gold': 1, 'Silver': 1, 'Bronze': 1, 'No Medal': 0})})
+
+    # Grouping to get the final dataframe for the app - sum of participants and number of medals count for the desired columns
+    groups = athlete_events.groupby(GROUP_COLUMNS, observed=True)
+    grouped = groups.agg({
+        'Participants': 'nunique',
+        'Number of Medals': 'sum'}).reset_index()
+
+    # The distinct athletes of every group, in the order of the grouped rows
+    athletes = pd.DataFrame({"group": groups.ngroup(), "ID": athlete_events["Participants"]})
+    athletes = athletes[athletes["group"] >= 0].drop_duplicates().sort_values(["group", "ID"])
+    return grouped, athletes[["ID"]].reset_index(drop=True)
+
+
+def gender_ratio_events(athlete_events):
+    """Count the participants per GENDER_COLUMNS and the ratio of each sex per year and country."""
+    gender_ratios = athlete_events.groupby(GENDER_COLUMNS, as_index=False, observed=True).agg(
+        {'Participants': 'nunique'}).rename(columns={"Participants": "Count"})
+    gender_ratios['Ratio'] = gender_ratios['Count'] / gender_ratios.groupby(['Year', 'Country'], observed=True)['Count'].transform('sum')
+    return gender_ratios
+
+
+def country_rollups(grouped_final_athlete_events, participant_ids):
+    """Distinct participants and the sum of medals per country over all Games, as shown by the maps without filters."""
+    grouped_final_athlete_events = compact_frame(grouped_final_athlete_events)
+    rollups = grouped_final_athlete_events.groupby(ROLLUP_COLUMNS, as_index=False, observed=True).agg(
+        {"Number of Medals": "sum"})
+    participants = ParticipantIndex(grouped_final_athlete_events, participant_ids["ID"]).count(None, "Country")
+    rollups.insert(len(ROLLUP_COLUMNS), "Participants", participants[rollups["Country"].cat.codes])
+    return rollups
+
+
+def load_regions():
+    """Country, continent and coordinates per NOC, like the merge in assignment_2.ipynb."""
+    noc_regions = pd.read_csv(os.path.join(DATA_DIR, "noc_regions.csv"), usecols=["NOC", "region"])
+    noc_regions = noc_regions.rename(columns={"region": "Country"})
+    country_continent_coordinates = pd.read_csv(os.path.join(DATA_DIR, "country_continent_coordinates.csv"))
+    return noc_regions.merge(country_continent_coordinates, on="Country")
+
+
+def read_ingested():
+    """Read the aggregates of all ingested Games, as a list of dataframes per prepared dataframe."""
+    frames = {"grouped_final_athlete_events": [], "gender_ratios": [], "participant_ids": []}
+    for name in ingested_files():
+        for frame in frames:
+            if name.endswith(f"_{frame}.csv"):
+                frames[frame].append(pd.read_csv(os.path.join(DATA_DIR, name)))
+    return frames
+
+
+def source_files():
+    """Paths of the source CSV files relative to DATA_DIR, the output of etl.py when present."""
+    if has_prepared():
+        return [os.path.join("prepared", name) for name in PREPARED_FILES.values()]
+    return SOURCE_FILES
+
+
+def ingested_files():
+    """Paths of the ingested aggregates relative to DATA_DIR, in a stable order."""
+    if not os.path.isdir(INGESTED_DIR):
+        return []
+    return [os.path.join("ingested", name) for name in sorted(os.listdir(INGESTED_DIR)) if name.endswith(".csv")]
+
+
+def finish_frames(frames):
+    """Compact the prepared dataframes and sort the grouped medals for the app."""
+    frames = {name: compact_frame(df) for name, df in frames.items()}
+    # Sorting once by number of medals so every filtered view keeps that order without sorting again
+    frames.update(sort_grouped(frames["grouped_final_athlete_events"], frames["participant_ids"],
+                               by="Number of Medals", ascending=False))
+    if "country_rollups" not in frames:
+        frames["country_rollups"] = compact_frame(country_rollups(frames["grouped_final_athlete_events"], frames["participant_ids"]))
+    return frames
+
+
+def sort_grouped(grouped_final_athlete_events, participant_ids, **sort):
+    """Sort the grouped medals with sort_values(**sort) and their participant IDs along with them."""
+    grouped_final_athlete_events = grouped_final_athlete_events.reset_index(drop=True)
+    rows = grouped_final_athlete_events.sort_values(kind="stable", **sort).index.to_numpy()
+    ids = take_groups(participant_ids["ID"].to_numpy(), grouped_final_athlete_events["Participants"].to_numpy(), rows)
+    return {
+        "grouped_final_athlete_events": grouped_final_athlete_events.take(rows).reset_index(drop=True),
+        "participant_ids": pd.DataFrame({"ID": ids}),
+    }
+
+
+def compact_frame(df):
+    """Return the dataframe with narrow numeric types and the string columns as categories."""
+    dtypes = {column: NUMERIC_DTYPES[column] for column in df.columns if column in NUMERIC_DTYPES}
+    dtypes.update({column: "category" for column in df.columns if df[column].dtype == object})
+    return df.astype(dtypes)
+
+
+############### Columnar cache on disk ###############
+
+def source_hash(staged=None):
+    """Hash of the cache version and the contents of the source files.
+
+    The hashes are remembered together with size and modification time of the files,
+    so the files are only read again when they have changed. staged maps the names of files that
+    are about to be moved into DATA_DIR to where they are written for now, so the version of the data
+    is known before they are in place. Renaming a file keeps its size and modification time.
+    """
+    staged = staged or {}
+    stats_path = os.path.join(CACHE_DIR, "sources.json")
+    try:
+        with open(stats_path) as f:
+            known = json.load(f)
+    except (OSError, ValueError):
+        known = {}
+
+    digest = hashlib.sha256(f"version {CACHE_VERSION}".encode())
+    changed = False
+    for name in source_files() + sorted(set(ingested_files()) | set(staged)):
+        path = staged.get(name, os.path.join(DATA_DIR, name))
+        stat = os.stat(path)
+        entry = known.get(name)
+        if not entry or entry["size"] != stat.st_size or entry["mtime_ns"] != stat.st_mtime_ns:
+            file_digest = hashlib.sha256()
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    file_digest.update(block)
+            entry = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": file_digest.hexdigest()}
+            known[name] = entry
+            changed = True
+        digest.update(f"{name} {entry['sha256']}".encode())
+
+    if changed:
+        _write_json_atomic(stats_path, known)
+    return digest.hexdigest()
+
+
+def write_frames(path, frames):
+    """Write the dataframes to the folder path, one .npy file per column.
+
+    String columns are stored as categorical codes with the categories in meta.json.
+    The folder is written next to its final place and renamed, so readers never see half a cache.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = tempfile.mkdtemp(prefix=".tmp-", dir=os.path.dirname(path))
+    try:
+        meta = {"version": CACHE_VERSION, "frames": {}}
+        for name, df in frames.items():
+            os.makedirs(os.path.join(tmp_path, name))
+            columns = []
+            for i, column in enumerate(df.columns):
+                values = df[column]
+                if values.dtype == object:
+                    values = values.astype("category")
+                filename = f"{i}.npy"
+                if isinstance(values.dtype, pd.CategoricalDtype):
+                    np.save(os.path.join(tmp_path, name, filename), values.cat.codes.to_numpy())
+                    columns.append({"name": column, "file": filename,
+                                    "categories": values.cat.categories.tolist()})
+                else:
+                    np.save(os.path.join(tmp_path, name, filename), values.to_numpy())
+                    columns.append({"name": column, "file": filename})
+            meta["frames"][name] = columns
+        with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+            json.dump(meta, f)
+        os.rename(tmp_path, path)
+    except OSError:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        # Another worker finished the same cache first, which is just as good
+        if not os.path.exists(os.path.join(path, "meta.json")):
+            raise
+
+
+def read_frames(path):
+    """Read dataframes written by write_frames, with the column files memory-mapped."""
+    with open(os.path.join(path, "meta.json")) as f:
+        meta = json.load(f)
+    frames = {}
+    for name, columns in meta["frames"].items():
+        data = {}
+        for column in columns:
+            values = np.load(os.path.join(path, name, column["file"]), mmap_mode="r")
+            if "categories" in column:
+                values = pd.Categorical.from_codes(values, categories=column["categories"])
+            data[column["name"]] = values
+        frames[name] = pd.DataFrame(data, copy=False)
+    return frames
+
+
+def data_version(staged=None):
+    """Name of the cache for the current source files, also used as the version of the data."""
+    return f"v{CACHE_VERSION}-{source_hash(staged)[:16]}"
+
+
+def has_cache(version):
+    """Whether the cache of the data version has been written."""
+    return os.path.exists(os.path.join(CACHE_DIR, version, "meta.json"))
+
+
+def load_frames(version=None):
+    """Return the prepared dataframes, from the cache when the source files are unchanged."""
+    version = version or data_version()
+    path = os.path.join(CACHE_DIR, version)
+    if not has_cache(version):
+        write_frames(path, prepare_frames())
+        remove_old_caches(keep=version)
+    return read_frames(path)
+
+
+def remove_old_caches(keep):
+    """Remove the caches of all other data versions than keep.
+
+    Workers that still use an older version keep reading it, as its column files stay
+    memory-mapped until they reload.
+    """
+    for name in os.listdir(CACHE_DIR):
+        if name != keep and re.fullmatch(r"v\d+-[0-9a-f]{16}", name):
+            shutil.rmtree(os.path.join(CACHE_DIR, name), ignore_errors=True)
+
+
+def _write_json_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", dir=os.path.dirname(path))
+    with os.fdopen(fd, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
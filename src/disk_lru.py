@@ -0,0 +1,108 @@
+import os
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# Eviction goes down to this share of max_bytes, so a full cache is not listed again on the very next write
+EVICT_TO = 0.9
+# File in the folder with the size of all its files, shared by the workers
+SIZE_FILE = ".size"
+
+
+class LRUDirectory:
+    """Files in a folder on disk kept below max_bytes, shared by all gunicorn workers on the same machine.
+
+    Reading a file touches it, so the modification times give the LRU order used for the eviction.
+    The size of the folder is kept in its .size file, which every write of every worker updates under
+    a flock, so the folder is only listed again when the writes of all workers take it over max_bytes.
+    Without fcntl (Windows) the writes of the other workers can get lost from the total until the next
+    eviction lists the folder. A max_bytes of 0 keeps every file.
+    """
+
+    def __init__(self, directory, max_bytes, extensions):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # Only files with these extensions are counted and evicted, e.g. not the temporary files of writes
+        self.extensions = tuple(extensions)
+        self._lock = threading.Lock()
+
+    def read(self, path, touch=True):
+        """Return the contents of the file, None when it does not exist."""
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        if touch:
+            try:
+                os.utime(path)
+            except OSError:
+                pass  # Removed by another worker in the meantime
+        return data
+
+    def write(self, path, data):
+        """Write the file next to its final place and rename it, then evict when over max_bytes."""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        if self.max_bytes <= 0:
+            os.replace(tmp_path, path)
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock, open(os.path.join(self.directory, SIZE_FILE), "a+") as size_file:
+            if fcntl is not None:
+                # Freed again when the file is closed
+                fcntl.flock(size_file, fcntl.LOCK_EX)
+            size_file.seek(0)
+            try:
+                total = int(size_file.read())
+            except ValueError:
+                # A new folder, or one written before the size file: list it once
+                total = None
+            try:
+                # A file written again replaces the size of its old version
+                replaced = os.stat(path).st_size
+            except OSError:
+                replaced = 0
+            os.replace(tmp_path, path)
+            if total is None:
+                total = sum(size for _, size, _ in self.files())
+            else:
+                total += len(data) - replaced
+            if total > self.max_bytes:
+                total = self.evict()
+            size_file.seek(0)
+            size_file.truncate()
+            size_file.write(str(total))
+
+    def evict(self):
+        """Remove the least recently used files until the folder fits in EVICT_TO of max_bytes, return the size left."""
+        limit = self.max_bytes * EVICT_TO
+        files = sorted(self.files())
+        total = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if total <= limit:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass  # Already removed by another worker
+            total -= size
+        return total
+
+    def files(self):
+        """Yield (modification time, size, path) of every file in the folder and its subfolders."""
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith(self.extensions):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue  # Already removed by another worker
+                    yield stat.st_mtime_ns, stat.st_size, path
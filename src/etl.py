@@ -0,0 +1,109 @@
+"""Build the prepared data of the app from the raw athlete events, replacing the cells of assignment_2.ipynb.
+
+The raw file has the columns of athlete_events.csv (ID, Name, Sex, NOC, Year, Season, Sport, Medal, ...).
+It is read in chunks, mapped to countries and coordinates and split up per year into spill files.
+The years are then aggregated in a pool of processes, so the memory is bounded by a chunk plus
+the largest year per process instead of the whole file:
+
+    python etl.py ../data/athlete_events.csv [--chunksize 200000] [--workers 4]
+
+The grouped medals with their participant IDs, gender ratios and country rollups are written to data/prepared,
+which the app uses instead of final_df.csv and gender_ratios.csv when present.
+"""
+import argparse
+import os
+import pickle
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from data_store import (DATA_DIR, PREPARED_DIR, PREPARED_FILES, aggregate_events, country_rollups,
+                        gender_ratio_events, load_regions, sort_grouped)
+
+# The columns of the raw athlete events the prepared data is built from
+EVENT_COLUMNS = ["ID", "Sex", "NOC", "Year", "Season", "Sport", "Medal"]
+
+# Sort orders of the outputs, so the same input always gives the same files
+GROUP_ORDER = ["Year", "Season", "Country", "Sport", "Medal"]
+GENDER_ORDER = ["Year", "Country", "Sex"]
+
+
+def split_events(events_path, spill_dir, chunksize):
+    """Read the raw athlete events in chunks and spill the rows of every year to their own folder.
+
+    Gender ratios are counted per year over both seasons, so a year is the smallest part that
+    can be aggregated on its own. Returns the folders of the years.
+    """
+    regions = load_regions()
+    years = set()
+    chunks = pd.read_csv(events_path, usecols=EVENT_COLUMNS, chunksize=chunksize)
+    for number, chunk in enumerate(chunks):
+        # Every athlete is counted once as participant by the athlete ID, like in ingest.py
+        events = chunk.rename(columns={"ID": "Participants"}).merge(regions, on="NOC")
+        for year, rows in events.groupby("Year"):
+            year_dir = os.path.join(spill_dir, str(year))
+            os.makedirs(year_dir, exist_ok=True)
+            with open(os.path.join(year_dir, f"{number}.pkl"), "wb") as f:
+                pickle.dump(rows, f, protocol=pickle.HIGHEST_PROTOCOL)
+            years.add(year_dir)
+    return sorted(years)
+
+
+def aggregate_year(year_dir):
+    """Aggregate the spilled rows of one year, run in a worker process."""
+    parts = []
+    for name in sorted(os.listdir(year_dir)):
+        with open(os.path.join(year_dir, name), "rb") as f:
+            parts.append(pickle.load(f))
+    events = pd.concat(parts, ignore_index=True)
+    grouped, participant_ids = aggregate_events(events)
+    return grouped, participant_ids, gender_ratio_events(events)
+
+
+def run_etl(events_path, output_dir=PREPARED_DIR, chunksize=200_000, workers=None):
+    """Build the prepared dataframes from the raw athlete events and write them as CSV to output_dir."""
+    spill_dir = tempfile.mkdtemp(prefix="etl-")
+    try:
+        year_dirs = split_events(events_path, spill_dir, chunksize)
+        if not year_dirs:
+            raise ValueError(f"None of the rows of {events_path} has a NOC with a known country and coordinates")
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(aggregate_year, year_dirs))
+    finally:
+        shutil.rmtree(spill_dir, ignore_errors=True)
+
+    frames = sort_grouped(pd.concat([result[0] for result in results], ignore_index=True),
+                          pd.concat([result[1] for result in results], ignore_index=True), by=GROUP_ORDER)
+    frames["gender_ratios"] = pd.concat([result[2] for result in results], ignore_index=True).sort_values(
+        GENDER_ORDER, kind="stable", ignore_index=True)
+    # The athlete IDs of the years are merged into the distinct participants per country over all years
+    frames["country_rollups"] = country_rollups(frames["grouped_final_athlete_events"], frames["participant_ids"])
+
+    # All files are written next to the output folder and moved in together, so the app never reads a mix
+    os.makedirs(os.path.dirname(os.path.abspath(output_dir)), exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix=".tmp-", dir=os.path.dirname(os.path.abspath(output_dir)))
+    for name, df in frames.items():
+        df.to_csv(os.path.join(tmp_dir, PREPARED_FILES[name]), index=False)
+    shutil.rmtree(output_dir, ignore_errors=True)
+    os.rename(tmp_dir, output_dir)
+    return frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the prepared data of the app from the raw athlete events.")
+    parser.add_argument("events", nargs="?", default=os.path.join(DATA_DIR, "athlete_events.csv"),
+                        help="CSV file in the format of athlete_events.csv")
+    parser.add_argument("--output", default=PREPARED_DIR, help="folder of the prepared CSV files")
+    parser.add_argument("--chunksize", type=int, default=200_000, help="rows read from the events at a time")
+    parser.add_argument("--workers", type=int, help="processes aggregating the years, all CPUs by default")
+    args = parser.parse_args()
+
+    frames = run_etl(args.events, args.output, chunksize=args.chunksize, workers=args.workers)
+    rows = ", ".join(f"{len(df)} {name}" for name, df in frames.items())
+    print(f"Prepared {rows} from {args.events} into {os.path.relpath(args.output)}")
+
+
+if __name__ == "__main__":
+    main()
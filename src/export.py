@@ -0,0 +1,131 @@
+import io
+import os
+import threading
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# Formats of the export route and their content types
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+# Query parameters of the filters and the columns they filter, the same as the dropdowns
+FILTER_PARAMETERS = {"year": "Year", "season": "Season", "sport": "Sport", "country": "Country"}
+
+
+class ExportSlots:
+    """At most `slots` exports at the same time over all gunicorn workers on the machine.
+
+    Every slot is a lock file in directory, held with flock while an export streams. The operating
+    system frees the lock when the file is closed or the worker dies, so a slot is never lost.
+    Without fcntl (Windows) the slots only count the exports of this process.
+    """
+
+    def __init__(self, directory, slots):
+        self.directory = directory
+        self.slots = slots
+        self._semaphore = threading.BoundedSemaphore(slots) if fcntl is None else None
+        os.makedirs(directory, exist_ok=True)
+
+    def acquire(self):
+        """Take a free slot and return the function that frees it again, or None when all slots are taken."""
+        if fcntl is None:
+            return self._semaphore.release if self._semaphore.acquire(blocking=False) else None
+        for slot in range(self.slots):
+            f = open(os.path.join(self.directory, f"slot-{slot}.lock"), "a")
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                f.close()
+                continue
+            # Closing the file frees the lock
+            return f.close
+        return None
+
+
+def parse_filters(args, allowed):
+    """Return the filters of the query as {column: [values]}, e.g. ?year=2012&year=2016&sport=Rowing.
+
+    Raises ValueError for a filter on a column that is not in allowed or a year that is not a number.
+    """
+    filters = {}
+    for parameter, column in FILTER_PARAMETERS.items():
+        values = args.getlist(parameter)
+        if not values:
+            continue
+        if column not in allowed:
+            raise ValueError(f"The {parameter} filter is not available for this dataset")
+        if column == "Year":
+            try:
+                values = [int(value) for value in values]
+            except ValueError:
+                raise ValueError("year must be a number") from None
+        filters[column] = values
+    return filters
+
+
+def parse_columns(args, columns):
+    """Return the columns of ?columns=Year,Country,... in that order, all columns by default."""
+    if not args.get("columns"):
+        return list(columns)
+    chosen = [column.strip() for column in args["columns"].split(",") if column.strip()]
+    unknown = [column for column in chosen if column not in columns]
+    if unknown:
+        raise ValueError(f"Unknown columns {', '.join(unknown)}, the columns are {', '.join(columns)}")
+    return chosen
+
+
+def parse_page(args):
+    """Return offset and limit of ?offset=...&limit=..., limit is None for all rows."""
+    try:
+        offset = int(args.get("offset", 0))
+        limit = int(args["limit"]) if args.get("limit") else None
+    except ValueError:
+        raise ValueError("offset and limit must be numbers") from None
+    if offset < 0:
+        raise ValueError("offset can not be negative")
+    # A page without rows would link to itself as the next page
+    if limit is not None and limit < 1:
+        raise ValueError("limit must be at least 1")
+    return offset, limit
+
+
+def stream_rows(df, rows, columns, export_format, chunk_rows=10_000):
+    """Yield the rows of df at the positions rows in the export format, a chunk of rows at a time.
+
+    Only one chunk is taken from the dataframe at a time, so the whole export is never in memory.
+    """
+    if export_format == "arrow":
+        yield from _stream_arrow(df, rows, columns, chunk_rows)
+        return
+    for start in range(0, max(len(rows), 1), chunk_rows):
+        chunk = df.take(rows[start:start + chunk_rows])[columns]
+        if export_format == "csv":
+            # The header comes with the first chunk, also when there are no rows
+            yield chunk.to_csv(index=False, header=start == 0)
+        elif len(chunk):
+            text = chunk.to_json(orient="records", lines=True)
+            yield text if text.endswith("\n") else text + "\n"
+
+
+def _stream_arrow(df, rows, columns, chunk_rows):
+    import pyarrow as pa  # Only needed for the Arrow format
+
+    sink = io.BytesIO()
+    schema = pa.Schema.from_pandas(df.take(np.empty(0, dtype=np.int64))[columns], preserve_index=False)
+    with pa.ipc.new_stream(sink, schema) as writer:
+        for start in range(0, len(rows), chunk_rows):
+            chunk = df.take(rows[start:start + chunk_rows])[columns]
+            writer.write_batch(pa.RecordBatch.from_pandas(chunk, schema=schema, preserve_index=False))
+            yield sink.getvalue()
+            sink.seek(0)
+            sink.truncate()
+    # The end of the stream, written when the writer is closed
+    yield sink.getvalue()
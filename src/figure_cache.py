@@ -0,0 +1,95 @@
+import functools
+import hashlib
+import json
+import os
+import threading
+
+import plotly.io as pio
+
+from disk_lru import LRUDirectory
+
+
+def normalize(value):
+    """Normalize a callback input, so equal filter states give equal cache keys.
+
+    Empty values all mean "no filter" and the order of a multi selection does not matter,
+    so [2016, 2012] and [2012, 2016] are the same state.
+    """
+    if value in [None, "", []]:
+        return None
+    if isinstance(value, (list, tuple, set)):
+        return sorted(set(value), key=lambda item: (str(type(item)), item))
+    return value
+
+
+class FigureCache:
+    """LRU cache of figures on disk, shared by all gunicorn workers on the same machine.
+
+    Every figure is stored as a JSON file named after its key, in an LRUDirectory that stays below max_bytes.
+    """
+
+    def __init__(self, directory, max_bytes, version=""):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # Part of every key, so figures of an older version of the data are never served
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+        self.files = LRUDirectory(directory, max_bytes, extensions=[".json"])
+        self._lock = threading.Lock()
+        if self.enabled:
+            os.makedirs(directory, exist_ok=True)
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def key(self, name, args):
+        state = json.dumps([self.version, name, [normalize(arg) for arg in args]], default=str)
+        return hashlib.sha256(state.encode()).hexdigest()
+
+    def get(self, key):
+        data = self.files.read(os.path.join(self.directory, key + ".json"))
+        try:
+            # Parsed with the JSON engine of plotly, orjson when the app has set it
+            figure = None if data is None else pio.json.from_json_plotly(data)
+        except ValueError:
+            figure = None
+        self._count(hit=figure is not None)
+        return figure
+
+    def put(self, key, figure):
+        # The folder is only listed when the figures written by all workers take it over max_bytes
+        self.files.write(os.path.join(self.directory, key + ".json"), pio.to_json(figure, validate=False).encode())
+
+    def stats(self):
+        """Hit and miss counts of this worker process."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = self.misses = 0
+
+    def cached(self, name):
+        """Decorator caching the figure returned by a callback function under its name and inputs."""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args):
+                if not self.enabled:
+                    return func(*args)
+                key = self.key(name, args)
+                figure = self.get(key)
+                if figure is None:
+                    figure = func(*args)
+                    self.put(key, figure)
+                return figure
+            return wrapper
+        return decorator
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
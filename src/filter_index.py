@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+
+# The columns the dropdowns of the app can filter on
+FILTER_COLUMNS = ("Year", "Season", "Sport", "Country")
+
+
+def filter_values(values):
+    """Return the values of a dropdown filter as a list, or None when it does not filter.
+
+    Empty values (None, "" or []) are ignored, just like an empty dropdown, and a single value
+    becomes a list of one value. Used by every index of the app, so they all read filters the same way.
+    """
+    if values in [None, "", []]:
+        return None
+    if not isinstance(values, (list, tuple, set)):
+        return [values]
+    return list(values)
+
+
+class FilterIndex:
+    """Sorted row positions per value for the filter columns of a dataframe.
+
+    Built once at startup, so a combination of dropdown filters becomes an
+    intersection of position arrays plus a single gather of the rows, instead
+    of parsing and evaluating a df.query() over the whole frame each time.
+    """
+
+    def __init__(self, df, columns=FILTER_COLUMNS):
+        self.df = df
+        self.positions = {}
+        for column in columns:
+            # Stable sort of the value codes keeps the row positions of every value in ascending order
+            codes, uniques = pd.factorize(df[column])
+            order = np.argsort(codes, kind="stable")
+            bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+            # 32 bit positions are enough for the app and halve the memory of the index
+            if len(df) < np.iinfo(np.int32).max:
+                order = order.astype(np.int32)
+            self.positions[column] = {
+                value: order[bounds[i]:bounds[i + 1]] for i, value in enumerate(uniques.tolist())
+            }
+
+    def select(self, **filters):
+        """Return the sorted row positions matching all filters, or None when no filter is active.
+
+        Every keyword is a column name with a value or list of values, e.g. select(Year=[2012, 2016]),
+        read with filter_values.
+        """
+        matches = []
+        for column, values in filters.items():
+            values = filter_values(values)
+            if values is None:
+                continue
+            index = self.positions[column]
+            parts = [index[value] for value in values if value in index]
+            # A row only has one value per column, so the union is a plain sorted concatenation
+            matches.append(np.sort(np.concatenate(parts)) if parts else np.empty(0, dtype=np.int32))
+
+        if not matches:
+            return None
+        # Intersect starting with the smallest set to keep the intermediate results small
+        matches.sort(key=len)
+        rows = matches[0]
+        for other in matches[1:]:
+            rows = np.intersect1d(rows, other, assume_unique=True)
+        return rows
+
+    def filter(self, **filters):
+        """Return the rows of the indexed dataframe matching all filters."""
+        rows = self.select(**filters)
+        if rows is None:
+            return self.df
+        return self.df.take(rows)
@@ -0,0 +1,98 @@
+"""Add the athlete events of new Games to the data of the app without a full rebuild.
+
+The new rows have the columns of athlete_events.csv (ID, Name, Sex, NOC, Year, Season, Sport, Medal, ...).
+They are mapped to countries and coordinates, aggregated per Games into data/ingested and merged into
+the cached dataframes of the app. Running workers pick up the new data on their next reload check.
+
+    python ingest.py new_athlete_events.csv [--replace]
+"""
+import argparse
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from data_store import (DATA_DIR, INGESTED_DIR, CACHE_DIR, aggregate_events, data_version, finish_frames,
+                        gender_ratio_events, load_frames, load_regions, remove_old_caches, write_frames)
+from participant_index import take_groups
+
+
+def ingest_events(athlete_events, replace=False):
+    """Merge new athlete events into the prepared dataframes and return the new data version.
+
+    Every Games (Year and Season) of the new rows is stored as its own aggregates, so a Games can be
+    ingested again with replace=True when more results come in. Games of final_df.csv can not be replaced.
+    Rows with a NOC without a known country and coordinates are left out, like in assignment_2.ipynb.
+    """
+    # Every athlete is counted once as participant by the athlete ID
+    events = athlete_events.rename(columns={"ID": "Participants"}).merge(load_regions(), on="NOC")
+    if events.empty:
+        raise ValueError("None of the rows has a NOC with a known country and coordinates")
+
+    frames = load_frames()
+    grouped = frames["grouped_final_athlete_events"]
+    gender_ratios = frames["gender_ratios"]
+    participant_ids = frames["participant_ids"]
+
+    new_games = []
+    for (year, season), games in events.groupby(["Year", "Season"]):
+        prefix = os.path.join(INGESTED_DIR, f"{year}_{season}")
+        already_ingested = os.path.exists(f"{prefix}_grouped_final_athlete_events.csv")
+        in_data = ((grouped["Year"] == year) & (grouped["Season"] == season)).any()
+        if in_data and not already_ingested:
+            raise ValueError(f"The {year} {season} Games are part of final_df.csv and can not be ingested again")
+        if already_ingested and not replace:
+            raise ValueError(f"The {year} {season} Games are already ingested, use replace to ingest them again")
+
+        # Gender ratios are per year, which is the same as per Games since the Summer and Winter Games alternate
+        new_games.append((prefix, *aggregate_events(games), gender_ratio_events(games)))
+        # Rows of a replaced Games are dropped from the current data, together with their participant IDs
+        kept = np.flatnonzero(~((grouped["Year"] == year) & (grouped["Season"] == season)).to_numpy())
+        participant_ids = pd.DataFrame({"ID": take_groups(participant_ids["ID"].to_numpy(), grouped["Participants"].to_numpy(), kept)})
+        grouped = grouped.take(kept)
+        gender_ratios = gender_ratios[gender_ratios["Year"] != year]
+
+    # The aggregates are written to a staging folder first. Workers pick up new data as soon as the files are
+    # in data/ingested, so they are only moved there once the cache of the new version is written
+    os.makedirs(INGESTED_DIR, exist_ok=True)
+    staging_dir = tempfile.mkdtemp(prefix=".tmp-", dir=INGESTED_DIR)
+    try:
+        staged = {}
+        for prefix, grouped_games, participant_games, gender_games in new_games:
+            for frame, df in [("grouped_final_athlete_events", grouped_games), ("participant_ids", participant_games),
+                              ("gender_ratios", gender_games)]:
+                name = f"{os.path.basename(prefix)}_{frame}.csv"
+                df.to_csv(os.path.join(staging_dir, name), index=False)
+                staged[os.path.join("ingested", name)] = os.path.join(staging_dir, name)
+
+        # The new cache is the current one plus the new Games, instead of a rebuild from all CSV files
+        new_version = data_version(staged)
+        merged = finish_frames({
+            "grouped_final_athlete_events": pd.concat([grouped] + [games[1] for games in new_games], ignore_index=True),
+            "gender_ratios": pd.concat([gender_ratios] + [games[3] for games in new_games], ignore_index=True),
+            "participant_ids": pd.concat([participant_ids] + [games[2] for games in new_games], ignore_index=True),
+        })
+        write_frames(os.path.join(CACHE_DIR, new_version), merged)
+        for name, path in staged.items():
+            os.replace(path, os.path.join(DATA_DIR, name))
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+    remove_old_caches(keep=new_version)
+    return new_version
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Add the athlete events of new Games to the data of the app.")
+    parser.add_argument("events", help="CSV file with athlete events in the format of athlete_events.csv")
+    parser.add_argument("--replace", action="store_true", help="replace Games that were ingested before")
+    args = parser.parse_args()
+
+    athlete_events = pd.read_csv(args.events)
+    version = ingest_events(athlete_events, replace=args.replace)
+    print(f"Ingested {len(athlete_events)} rows from {args.events} into {os.path.relpath(DATA_DIR)}, data version {version}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+import contextlib
+import functools
+import itertools
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds of the latency histogram of the callbacks
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# The summed metrics of the workers that have stopped
+RETIRED_FILE = "retired.json"
+
+
+class Metrics:
+    """Timings of the figure callbacks per phase, payload sizes and counters of the gunicorn workers.
+
+    Rendered in the Prometheus text format by the /metrics route of the app. Every worker keeps its own
+    metrics and, with a directory, writes them to a file in it after every request that changed them.
+    A scrape then gets the sum over the files of all workers, whichever worker answers it.
+    Every running worker holds a flock on a lock file next to its metrics file. A scrape adds the files
+    of the workers whose lock is free, the stopped ones, to retired.json and removes them, so the sums
+    never go down and the folder does not grow with every restart. Without fcntl (Windows) the files of
+    stopped workers are kept as they are.
+    Without a directory only the metrics of the answering worker are rendered, with a worker label.
+    """
+
+    def __init__(self, slow_callback_ms=None, directory=None):
+        # Callbacks slower than this are logged together with their inputs, None turns the log off
+        self.slow_callback_ms = slow_callback_ms
+        self.directory = directory
+        self.phases = {}
+        self.latencies = {}
+        self.counters = {}
+        self._changed = False
+        self._lock = threading.Lock()
+        # The metrics file of this process, set by the first flush after a fork
+        self._pid = None
+        self._path = None
+        self._alive = None
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @contextlib.contextmanager
+    def phase(self, callback, name):
+        """Time a phase of a callback, e.g. the filtering, aggregation or building of a figure."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe_phase(callback, name, time.perf_counter() - start)
+
+    def observe_phase(self, callback, name, seconds):
+        with self._lock:
+            total, count = self.phases.get((callback, name), (0.0, 0))
+            self.phases[(callback, name)] = (total + seconds, count + 1)
+            self._changed = True
+
+    def timed(self, callback):
+        """Decorator timing every call of a callback function and logging the slow ones."""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args):
+                start = time.perf_counter()
+                try:
+                    return func(*args)
+                finally:
+                    self.observe_latency(callback, time.perf_counter() - start, args)
+            return wrapper
+        return decorator
+
+    def observe_latency(self, callback, seconds, args=()):
+        with self._lock:
+            buckets, total, count = self.latencies.get(callback, ([0] * len(LATENCY_BUCKETS), 0.0, 0))
+            buckets = [n + (seconds <= bound) for n, bound in zip(buckets, LATENCY_BUCKETS)]
+            self.latencies[callback] = (buckets, total + seconds, count + 1)
+            self._changed = True
+        if self.slow_callback_ms is not None and seconds * 1000 >= self.slow_callback_ms:
+            logger.warning("Slow callback %s took %.0f ms with inputs %r", callback, seconds * 1000, args)
+
+    def increment(self, name, value=1, **labels):
+        """Add to a counter, e.g. increment("export_requests_total", dataset="gender_ratios", format="csv")."""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+            self._changed = True
+
+    def reset(self):
+        """Forget all metrics, e.g. those of the gunicorn master that every forked worker would count again."""
+        with self._lock:
+            self.phases, self.latencies, self.counters = {}, {}, {}
+
+    def snapshot(self, extra_counters=()):
+        """The metrics of this worker as JSON data, extra_counters like for render."""
+        with self._lock:
+            snapshot = _as_snapshot(self.phases, self.latencies, self.counters)
+        snapshot["counters"] += [[name, labels, value] for name, labels, value in extra_counters]
+        return snapshot
+
+    def flush(self, extra_counters=(), force=False):
+        """Write the metrics of this worker to its file in the directory, when they changed since the last flush."""
+        if not self.directory or not (self._changed or force):
+            return
+        self._changed = False
+        path = self._worker_path()
+        fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", dir=self.directory)
+        with os.fdopen(fd, "w") as f:
+            json.dump(self.snapshot(extra_counters), f)
+        os.replace(tmp_path, path)
+
+    def render(self, extra_counters=()):
+        """The metrics in the Prometheus text format, summed over all workers when there is a directory.
+
+        extra_counters are (name, labels, value) of counters kept elsewhere, like the figure cache.
+        """
+        if self.directory:
+            # The file of this worker is brought up to date first, the others are as of their last request
+            self.flush(extra_counters, force=True)
+            # Read under the lock, so a scrape never sees a stopped worker both in its file and in retired.json
+            with self._directory_lock():
+                self._retire_stopped_workers()
+                snapshots, worker = self._read_snapshots(), {}
+        else:
+            snapshots, worker = [self.snapshot(extra_counters)], {"worker": str(os.getpid())}
+
+        phases, latencies, counters = _sum(snapshots)
+
+        lines = [
+            "# HELP callback_phase_seconds Time spent per phase of the figure callbacks.",
+            "# TYPE callback_phase_seconds summary",
+        ]
+        for (callback, name), (total, count) in sorted(phases.items()):
+            labels = _labels(**worker, callback=callback, phase=name)
+            lines.append(f"callback_phase_seconds_sum{labels} {total:.6f}")
+            lines.append(f"callback_phase_seconds_count{labels} {count}")
+
+        lines += [
+            "# HELP callback_seconds Time of a whole figure callback.",
+            "# TYPE callback_seconds histogram",
+        ]
+        for callback, (buckets, total, count) in sorted(latencies.items()):
+            for bound, n in zip(LATENCY_BUCKETS, buckets):
+                lines.append(f"callback_seconds_bucket{_labels(**worker, callback=callback, le=bound)} {n}")
+            lines.append(f"callback_seconds_bucket{_labels(**worker, callback=callback, le='+Inf')} {count}")
+            lines.append(f"callback_seconds_sum{_labels(**worker, callback=callback)} {total:.6f}")
+            lines.append(f"callback_seconds_count{_labels(**worker, callback=callback)} {count}")
+
+        for name, family in itertools.groupby(sorted(counters.items()), key=lambda counter: counter[0][0]):
+            lines.append(f"# TYPE {name} counter")
+            for (_, labels), value in family:
+                lines.append(f"{name}{_labels(**worker, **dict(labels))} {value}")
+        return "\n".join(lines) + "\n"
+
+    def _worker_path(self):
+        # Named after the process and a random id, so a worker that gets the PID of a stopped worker
+        # never overwrites its file. Checked on every flush, as the workers are forked from the master
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            name = f"worker-{self._pid}-{uuid.uuid4().hex[:12]}"
+            self._path = os.path.join(self.directory, name + ".json")
+            if fcntl is not None:
+                # Held until the process ends, which tells the other workers that this one is still running
+                with self._directory_lock():
+                    self._alive = open(os.path.join(self.directory, name + ".lock"), "w")
+                    fcntl.flock(self._alive, fcntl.LOCK_EX)
+        return self._path
+
+    @contextlib.contextmanager
+    def _directory_lock(self):
+        # Taken to add a worker and to retire workers, so a worker is never retired before it holds its lock
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.directory, ".lock"), "w") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            yield
+
+    def _retire_stopped_workers(self):
+        # Adds the files of the stopped workers to retired.json and removes them, with the directory lock held
+        if fcntl is None:
+            return
+        stopped = []
+        for name in os.listdir(self.directory):
+            if name.startswith("worker-") and name.endswith(".lock"):
+                with open(os.path.join(self.directory, name)) as f:
+                    try:
+                        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except OSError:
+                        continue  # Still running
+                stopped.append(os.path.join(self.directory, name[:-len(".lock")]))
+        if not stopped:
+            return
+        paths = [os.path.join(self.directory, RETIRED_FILE)] + [path + ".json" for path in stopped]
+        retired = _as_snapshot(*_sum(filter(None, map(_read_snapshot, paths))))
+        fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", dir=self.directory)
+        with os.fdopen(fd, "w") as f:
+            json.dump(retired, f)
+        os.replace(tmp_path, paths[0])
+        for path in stopped:
+            for extension in [".json", ".lock"]:
+                try:
+                    os.remove(path + extension)
+                except OSError:
+                    pass  # A worker that stopped before its first flush
+
+    def _read_snapshots(self):
+        names = [name for name in os.listdir(self.directory) if name.endswith(".json")]
+        return list(filter(None, (_read_snapshot(os.path.join(self.directory, name)) for name in names)))
+
+
+def _read_snapshot(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _sum(snapshots):
+    # The phases, latencies and counters of several snapshots added up
+    phases, latencies, counters = {}, {}, {}
+    for snapshot in snapshots:
+        for callback, name, total, count in snapshot["phases"]:
+            before = phases.get((callback, name), (0.0, 0))
+            phases[(callback, name)] = (before[0] + total, before[1] + count)
+        for callback, buckets, total, count in snapshot["latencies"]:
+            before = latencies.get(callback, ([0] * len(LATENCY_BUCKETS), 0.0, 0))
+            latencies[callback] = ([a + b for a, b in zip(before[0], buckets)], before[1] + total, before[2] + count)
+        for name, labels, value in snapshot["counters"]:
+            key = (name, tuple(sorted(labels.items())))
+            counters[key] = counters.get(key, 0) + value
+    return phases, latencies, counters
+
+
+def _as_snapshot(phases, latencies, counters):
+    return {
+        "phases": [[callback, name, total, count] for (callback, name), (total, count) in phases.items()],
+        "latencies": [[callback, buckets, total, count] for callback, (buckets, total, count) in latencies.items()],
+        "counters": [[name, dict(labels), value] for (name, labels), value in counters.items()],
+    }
+
+
+def _labels(**labels):
+    if not labels:
+        return ""
+    values = ",".join(f'{key}="{str(value)}"' for key, value in labels.items())
+    return "{" + values + "}"
@@ -0,0 +1,46 @@
+import numpy as np
+
+
+def take_groups(ids, counts, rows):
+    """Return the IDs of the given grouped rows, in the order of rows.
+
+    ids holds the IDs of every grouped row one after the other and counts the number of IDs per row,
+    like the participant_ids and the Participants column of the grouped medals.
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    starts = np.cumsum(counts) - counts
+    taken = counts[rows]
+    # Start of every taken row in ids, shifted by its start in the result, plus the position in the result
+    positions = np.repeat(starts[rows] - (np.cumsum(taken) - taken), taken) + np.arange(taken.sum())
+    return np.asarray(ids)[positions]
+
+
+class ParticipantIndex:
+    """Athlete IDs of every row of the grouped medals, for exact counts of distinct participants.
+
+    The Participants of a grouped row are its distinct athletes, so summing them over rows counts an
+    athlete once for every sport, medal and Games. Merging the IDs of the rows instead counts every
+    athlete once, for any combination of filters.
+    """
+
+    def __init__(self, df, ids):
+        self.df = df
+        self.ids = np.asarray(ids)
+        self.counts = df["Participants"].to_numpy(dtype=np.int64)
+        if self.counts.sum() != len(self.ids):
+            raise ValueError("The participant IDs do not match the Participants of the grouped medals")
+
+    def count(self, rows, column):
+        """Return the number of distinct participants of the rows per category code of column.
+
+        rows are row positions like FilterIndex.select returns them, None for all rows.
+        """
+        codes = self.df[column].cat.codes.to_numpy()
+        if rows is None:
+            rows = np.arange(len(self.df))
+        ids = take_groups(self.ids, self.counts, rows).astype(np.int64)
+        keys = np.repeat(codes[rows].astype(np.int64), self.counts[rows])
+        # Every pair of category and athlete is counted once
+        span = int(ids.max()) + 1 if len(ids) else 1
+        pairs = np.unique(keys * span + ids)
+        return np.bincount(pairs // span, minlength=len(self.df[column].cat.categories))
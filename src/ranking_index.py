@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+
+from filter_index import filter_values
+
+
+class RankingIndex:
+    """The rows with medals of every country, for the top sports of a country in any slice of the Games.
+
+    Built once per version of the data. A ranking only looks at the few hundred rows of one country,
+    counting them per sport with a bincount, instead of filtering and grouping the whole dataframe.
+    The rankings over all Games, shown when no year, season or sport is chosen, are computed up front.
+    """
+
+    def __init__(self, df, k=10):
+        self.k = k
+        medal_rows = df[df["Number of Medals"] > 0]
+        self.sports = np.asarray(df["Sport"].cat.categories)
+        self.categories = {column: df[column].cat.categories for column in ["Season", "Sport", "Medal"]}
+        self.countries = {}
+        for country, rows in medal_rows.groupby("Country", observed=True):
+            self.countries[country] = {
+                "Year": rows["Year"].to_numpy(),
+                "Season": rows["Season"].cat.codes.to_numpy(),
+                "Sport": rows["Sport"].cat.codes.to_numpy(),
+                "Medal": rows["Medal"].cat.codes.to_numpy(),
+            }
+        self.top = {
+            (country, medal): self._rank(country, None, medal)
+            for country in self.countries for medal in [None, "Gold"]
+        }
+
+    def top_sports(self, country, years=None, sports=None, season=None, medal=None):
+        """Return the k sports of the country with the most medal rows, as columns Sport and Number of Medals.
+
+        Like a count of the rows with medals grouped by sport, of one medal type when medal is given.
+        The filters are read with filter_values, like those of FilterIndex.select.
+        """
+        filters = {"Year": filter_values(years), "Sport": filter_values(sports), "Season": filter_values(season)}
+        if all(values is None for values in filters.values()):
+            top = self.top.get((country, medal))
+            return top.copy() if top is not None else self._empty()
+        return self._rank(country, filters, medal)
+
+    def _rank(self, country, filters, medal):
+        rows = self.countries.get(country)
+        if rows is None:
+            return self._empty()
+        mask = np.ones(len(rows["Year"]), dtype=bool)
+        for column, values in (filters or {}).items():
+            if values is None:
+                continue
+            if column == "Year":
+                mask &= np.isin(rows["Year"], values)
+            else:
+                mask &= np.isin(rows[column], self.categories[column].get_indexer(values))
+        if medal is not None:
+            mask &= rows["Medal"] == self.categories["Medal"].get_loc(medal)
+
+        counts = np.bincount(rows["Sport"][mask], minlength=len(self.sports))
+        ranked = np.flatnonzero(counts)
+        # Most medals first, sports with as many medals in alphabetical order
+        ranked = ranked[np.lexsort((self.sports[ranked], -counts[ranked]))][:self.k]
+        return pd.DataFrame({"Sport": self.sports[ranked], "Number of Medals": counts[ranked]})
+
+    def _empty(self):
+        return pd.DataFrame({"Sport": pd.Series(dtype=object), "Number of Medals": pd.Series(dtype=np.int64)})
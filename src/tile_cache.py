@@ -0,0 +1,154 @@
+"""Cache on disk of the basemap tiles of the map figures, served by the /tiles route of the app.
+
+Tiles are stored as <directory>/<source>/<z>/<x>/<y>.<png|jpg>, the layout of most tile exports, so a
+folder of downloaded tiles can be served as it is. The low zoom levels the dashboard shows can be
+fetched up front, e.g. while building the app:
+
+    python tile_cache.py --source usgs --max-zoom 4
+
+With TILE_OFFLINE=1 the app only serves tiles from the folder and never asks the tile servers.
+"""
+import argparse
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from data_store import CACHE_DIR
+from disk_lru import LRUDirectory
+
+# The tile servers of the maps, with {z}/{x}/{y} filled in per tile
+TILE_SOURCES = {
+    "usgs": {
+        "url": "https://basemap.nationalmap.gov/arcgis/rest/services/USGSImageryOnly/MapServer/tile/{z}/{y}/{x}",
+        "attribution": "United States Geological Survey",
+    },
+    "osm": {
+        "url": "https://tile.openstreetmap.org/{z}/{x}/{y}.png",
+        "attribution": "© OpenStreetMap contributors",
+    },
+}
+
+# File extensions of the tiles and their content types
+TILE_TYPES = {".png": "image/png", ".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".webp": "image/webp"}
+
+# The tile servers ask for an identifying user agent
+USER_AGENT = "OS-Project-dashboard tile cache"
+
+# Seconds before a tile that could not be fetched is tried again
+FAILURE_SECONDS = 60
+
+
+class TileCache:
+    """Cache of map tiles on disk in an LRUDirectory, shared by all gunicorn workers on the same machine.
+
+    A missing tile is fetched in a background thread, and get returns None meanwhile, so the route can
+    send the browser to the tile server instead of keeping a worker waiting. A tile that could not be
+    fetched is not tried again for FAILURE_SECONDS. When offline, missing tiles are never fetched.
+    """
+
+    def __init__(self, directory, max_bytes=0, offline=False, timeout=3, fetch_threads=2):
+        self.directory = directory
+        self.offline = offline
+        self.timeout = timeout
+        self.fetch_threads = fetch_threads
+        self.files = LRUDirectory(directory, max_bytes, extensions=TILE_TYPES)
+        # Tiles being fetched, and tiles that failed with the time they may be tried again
+        self._fetching = set()
+        self._failed = {}
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def get(self, source, z, x, y):
+        """Return the tile as (bytes, content type), or None when it is not cached (yet)."""
+        if not self.valid(source, z, x, y):
+            return None
+        tile = self.read(source, z, x, y)
+        if tile is None and not self.offline:
+            self.fetch_later(source, z, x, y)
+        return tile
+
+    def valid(self, source, z, x, y):
+        """Whether the tile is on the map of a known source."""
+        return source in TILE_SOURCES and 0 <= z <= 22 and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+    def url(self, source, z, x, y):
+        """URL of the tile on its tile server."""
+        return TILE_SOURCES[source]["url"].format(z=z, x=x, y=y)
+
+    def read(self, source, z, x, y):
+        base = os.path.join(self.directory, source, str(z), str(x), str(y))
+        for extension, content_type in TILE_TYPES.items():
+            # An offline folder may be read-only, so the tiles are not touched there
+            data = self.files.read(base + extension, touch=not self.offline)
+            if data is not None:
+                return data, content_type
+        return None
+
+    def fetch_later(self, source, z, x, y):
+        """Fetch a tile in a background thread, unless it is being fetched already or failed recently."""
+        key = (source, z, x, y)
+        with self._lock:
+            if key in self._fetching or self._failed.get(key, 0) > time.monotonic():
+                return
+            self._fetching.add(key)
+            # Started on first use, as threads do not survive the fork of the gunicorn workers
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.fetch_threads, thread_name_prefix="tile-fetch")
+        self._executor.submit(self._fetch_in_background, key)
+
+    def fetch(self, source, z, x, y):
+        """Fetch a tile from its tile server and store it, return None when that fails."""
+        request = urllib.request.Request(self.url(source, z, x, y), headers={"User-Agent": USER_AGENT})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                data = response.read()
+        except (urllib.error.URLError, OSError):
+            return None
+        extension = ".png" if data.startswith(b"\x89PNG") else ".jpg"
+        self.files.write(os.path.join(self.directory, source, str(z), str(x), f"{y}{extension}"), data)
+        return data, TILE_TYPES[extension]
+
+    def seed(self, source, max_zoom):
+        """Fetch every tile of a source up to max_zoom that is not cached yet, return the number of tiles."""
+        count = 0
+        for z in range(max_zoom + 1):
+            for x in range(2 ** z):
+                for y in range(2 ** z):
+                    if self.read(source, z, x, y) is None and self.fetch(source, z, x, y) is None:
+                        raise OSError(f"Could not fetch tile {z}/{x}/{y} of {source}")
+                    count += 1
+        return count
+
+    def _fetch_in_background(self, key):
+        try:
+            tile = self.fetch(*key)
+        except OSError:
+            tile = None
+        with self._lock:
+            self._fetching.discard(key)
+            if tile is None:
+                self._failed[key] = time.monotonic() + FAILURE_SECONDS
+            else:
+                self._failed.pop(key, None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fetch the low zoom levels of the basemap tiles into the tile cache.")
+    parser.add_argument("--source", choices=sorted(TILE_SOURCES), action="append",
+                        help="tile source to fetch, all sources by default")
+    parser.add_argument("--max-zoom", type=int, default=3, help="highest zoom level to fetch, 4**z tiles per level")
+    parser.add_argument("--directory", default=os.environ.get("TILE_CACHE_DIR", os.path.join(CACHE_DIR, "tiles")),
+                        help="folder of the tile cache")
+    args = parser.parse_args()
+
+    cache = TileCache(args.directory)
+    for source in args.source or sorted(TILE_SOURCES):
+        count = cache.seed(source, args.max_zoom)
+        print(f"{count} tiles of {source} up to zoom {args.max_zoom} in {os.path.relpath(args.directory)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# The modules of the app import each other from src, like when the app is started from there
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+
+@pytest.fixture
+def events():
+    """Small random athlete events with the columns of final_df.csv, a few athletes take part in several sports."""
+    rng = np.random.default_rng(0)
+    n = 3000
+    countries = {"Sweden": (60.1, 18.6), "Norway": (60.5, 8.5), "Kenya": (-0.02, 37.9), "Japan": (36.2, 138.3)}
+    country = rng.choice(list(countries), n)
+    year = rng.choice([2000, 2002, 2004, 2006, 2008], n)
+    return pd.DataFrame({
+        "Participants": rng.integers(1, 400, n),
+        "Year": year,
+        "Season": np.where(year % 4 == 0, "Summer", "Winter"),
+        "Medal": rng.choice(["Gold", "Silver", "Bronze", None], n, p=[0.1, 0.1, 0.1, 0.7]),
+        "Country": country,
+        "Sport": rng.choice(["Rowing", "Skiing", "Athletics", "Judo", "Curling"], n),
+        "Country_latitude": [countries[c][0] for c in country],
+        "Country_longitude": [countries[c][1] for c in country],
+    }).astype({"Season": "category", "Country": "category", "Sport": "category"})
@@ -0,0 +1,48 @@
+import os
+
+from disk_lru import EVICT_TO, LRUDirectory
+
+
+def test_least_recently_used_files_are_evicted(tmp_path):
+    files = LRUDirectory(str(tmp_path), max_bytes=1000, extensions=[".bin"])
+    for i in range(5):
+        files.write(str(tmp_path / f"{i}.bin"), b"x" * 300)
+        # Distinct modification times, the first file was read last
+        os.utime(tmp_path / f"{i}.bin", ns=(i * 10**9, i * 10**9))
+        assert files.read(str(tmp_path / "0.bin")) is not None
+    kept = sorted(os.path.basename(path) for _, _, path in files.files())
+    assert sum(size for _, size, _ in files.files()) <= 1000 * EVICT_TO
+    assert "0.bin" in kept and "4.bin" in kept
+
+
+def test_the_folder_is_only_listed_over_max_bytes(tmp_path, monkeypatch):
+    files = LRUDirectory(str(tmp_path), max_bytes=10_000, extensions=[".bin"])
+    files.write(str(tmp_path / "first.bin"), b"x" * 100)
+    listings = []
+    original = files.files
+    monkeypatch.setattr(files, "files", lambda: listings.append(1) or original())
+    for i in range(50):
+        files.write(str(tmp_path / f"{i}.bin"), b"x" * 100)
+    assert listings == []
+    files.write(str(tmp_path / "large.bin"), b"x" * 10_000)
+    assert len(listings) == 1
+
+
+def test_zero_max_bytes_keeps_every_file(tmp_path):
+    files = LRUDirectory(str(tmp_path / "tiles"), max_bytes=0, extensions=[".png"])
+    for i in range(3):
+        files.write(str(tmp_path / "tiles" / "osm" / f"{i}.png"), b"x" * 100)
+    assert len(list(files.files())) == 3
+    assert files.read(str(tmp_path / "missing.png")) is None
+
+
+def test_workers_share_one_size_budget(tmp_path):
+    # Two workers writing to the same folder, each with its own LRUDirectory
+    workers = [LRUDirectory(str(tmp_path), max_bytes=10_000, extensions=[".bin"]) for _ in range(2)]
+    for i in range(100):
+        workers[i % 2].write(str(tmp_path / f"{i}.bin"), b"x" * 300)
+        assert sum(size for _, size, _ in workers[0].files()) <= 10_000
+    # Writing a file again does not count its old size twice
+    for _ in range(50):
+        workers[0].write(str(tmp_path / "99.bin"), b"x" * 300)
+    assert int((tmp_path / ".size").read_text()) == sum(size for _, size, _ in workers[1].files())
@@ -0,0 +1,42 @@
+import multiprocessing
+
+import pytest
+
+from export import ExportSlots, parse_page
+
+
+def try_slot(directory, slots, result):
+    result.put(ExportSlots(directory, slots).acquire() is not None)
+
+
+def test_slots_are_limited_and_freed(tmp_path):
+    slots = ExportSlots(str(tmp_path), 2)
+    first, second = slots.acquire(), slots.acquire()
+    assert first is not None and second is not None
+    assert slots.acquire() is None
+    first()
+    third = slots.acquire()
+    assert third is not None
+    assert slots.acquire() is None
+    second()
+    third()
+
+
+def test_slots_are_shared_between_processes(tmp_path):
+    release = ExportSlots(str(tmp_path), 1).acquire()
+    result = multiprocessing.Queue()
+    for expected in [False, True]:
+        if expected:
+            release()
+        process = multiprocessing.Process(target=try_slot, args=(str(tmp_path), 1, result))
+        process.start()
+        process.join()
+        assert result.get() is expected
+
+
+def test_pages_have_at_least_one_row():
+    assert parse_page({"offset": "20", "limit": "10"}) == (20, 10)
+    assert parse_page({}) == (0, None)
+    for args in [{"limit": "0"}, {"limit": "-1"}, {"offset": "-1"}, {"limit": "ten"}]:
+        with pytest.raises(ValueError):
+            parse_page(args)
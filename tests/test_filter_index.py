@@ -0,0 +1,52 @@
+import itertools
+
+import numpy as np
+
+from filter_index import FilterIndex
+
+FILTERS = {
+    "Year": [None, [], 2004, [2000, 2008], [2002, 1900]],
+    "Season": [None, "Summer", ["Summer", "Winter"]],
+    "Sport": [None, "", ["Rowing"], ["Judo", "Curling", "Fencing"]],
+    "Country": [None, "Kenya", ["Sweden", "Norway"]],
+}
+
+
+def expected_rows(df, filters):
+    mask = np.ones(len(df), dtype=bool)
+    for column, values in filters.items():
+        if values in [None, "", []]:
+            continue
+        mask &= df[column].isin(values if isinstance(values, list) else [values]).to_numpy()
+    return np.flatnonzero(mask)
+
+
+def test_select_matches_a_boolean_mask(events):
+    index = FilterIndex(events)
+    for combination in itertools.product(*FILTERS.values()):
+        filters = dict(zip(FILTERS, combination))
+        rows = index.select(**filters)
+        if all(values in [None, "", []] for values in combination):
+            assert rows is None
+        else:
+            np.testing.assert_array_equal(rows, expected_rows(events, filters), err_msg=str(filters))
+
+
+def test_select_unknown_values_match_nothing(events):
+    index = FilterIndex(events)
+    assert len(index.select(Year=[1900])) == 0
+    assert len(index.select(Year=2004, Country="Atlantis")) == 0
+
+
+def test_filter_returns_the_selected_rows(events):
+    index = FilterIndex(events)
+    assert index.filter() is events
+    filtered = index.filter(Year=[2000, 2004], Sport="Rowing")
+    assert ((filtered["Year"].isin([2000, 2004])) & (filtered["Sport"] == "Rowing")).all()
+    assert len(filtered) == len(expected_rows(events, {"Year": [2000, 2004], "Sport": "Rowing"}))
+
+
+def test_select_on_a_subset_of_the_columns(events):
+    index = FilterIndex(events, columns=("Year", "Country"))
+    np.testing.assert_array_equal(index.select(Year=2006, Country=["Japan"]),
+                                  expected_rows(events, {"Year": 2006, "Country": "Japan"}))
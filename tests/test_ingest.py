@@ -0,0 +1,94 @@
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import data_store
+import ingest
+from data_store import GENDER_COLUMNS, GROUP_COLUMNS, data_version, load_frames, prepare_frames
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
+NOCS = {"SWE": "Sweden", "NOR": "Norway", "KEN": "Kenya", "JPN": "Japan"}
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch, events):
+    """A data folder with the events as final_df.csv, used by data_store and ingest instead of data/."""
+    for name in ["noc_regions.csv", "country_continent_coordinates.csv"]:
+        shutil.copy(os.path.join(DATA_DIR, name), tmp_path / name)
+    events.to_csv(tmp_path / "final_df.csv", index=False)
+    gender_ratios = events.assign(Sex="M", Continent="Europe", Continent_latitude=54.5, Continent_longitude=15.3)
+    gender_ratios = gender_ratios.groupby(GENDER_COLUMNS, as_index=False, observed=True).size().rename(columns={"size": "Count"})
+    gender_ratios.assign(Ratio=1.0).to_csv(tmp_path / "gender_ratios.csv")
+
+    paths = {"DATA_DIR": str(tmp_path), "CACHE_DIR": str(tmp_path / "cache"),
+             "INGESTED_DIR": str(tmp_path / "ingested"), "PREPARED_DIR": str(tmp_path / "prepared")}
+    for module in [data_store, ingest]:
+        for name, path in paths.items():
+            if hasattr(module, name):
+                monkeypatch.setattr(module, name, path)
+    return tmp_path
+
+
+def new_games(seed, years=((2010, "Winter"), (2012, "Summer")), n=800):
+    """Athlete events in the format of athlete_events.csv, with athletes that also took part in earlier Games."""
+    rng = np.random.default_rng(seed)
+    year, season = zip(*[years[i] for i in rng.integers(0, len(years), n)])
+    return pd.DataFrame({
+        "ID": rng.integers(300, 600, n),
+        "Name": "Athlete",
+        "Sex": rng.choice(["M", "F"], n),
+        "NOC": rng.choice(list(NOCS), n),
+        "Year": year,
+        "Season": season,
+        "Sport": rng.choice(["Rowing", "Skiing", "Biathlon"], n),
+        "Medal": rng.choice(["Gold", "Silver", "Bronze", None], n, p=[0.1, 0.1, 0.1, 0.7]),
+    })
+
+
+def comparable(frames):
+    """The frames independent of row order and categories: grouped rows with their IDs, gender ratios and rollups."""
+    grouped = frames["grouped_final_athlete_events"]
+    counts = grouped["Participants"].to_numpy()
+    ids = np.split(frames["participant_ids"]["ID"].to_numpy(), np.cumsum(counts)[:-1])
+    keys = grouped[GROUP_COLUMNS].astype(object).itertuples(index=False, name=None)
+    rows = {key: (participants, medals, tuple(sorted(row_ids)))
+            for key, participants, medals, row_ids in zip(keys, counts, grouped["Number of Medals"], ids)}
+    assert len(rows) == len(grouped)
+
+    def plain(df):
+        return df.astype(object).sort_values(list(df.columns)).reset_index(drop=True)
+    return rows, plain(frames["gender_ratios"]), plain(frames["country_rollups"])
+
+
+def assert_same_as_rebuild(version):
+    ingested = comparable(load_frames(version))
+    rebuilt = comparable(prepare_frames())
+    assert ingested[0] == rebuilt[0]
+    pd.testing.assert_frame_equal(ingested[1], rebuilt[1])
+    pd.testing.assert_frame_equal(ingested[2], rebuilt[2])
+
+
+def test_ingest_matches_a_full_rebuild(data_dir):
+    version = ingest.ingest_events(new_games(seed=1))
+    assert version == data_version()
+    assert sorted(os.listdir(data_dir / "cache")) == ["sources.json", version]
+    assert len(os.listdir(data_dir / "ingested")) == 6
+    assert_same_as_rebuild(version)
+
+
+def test_replaced_games_match_a_full_rebuild(data_dir):
+    ingest.ingest_events(new_games(seed=1))
+    with pytest.raises(ValueError, match="already ingested"):
+        ingest.ingest_events(new_games(seed=2, years=[(2012, "Summer")]))
+    version = ingest.ingest_events(new_games(seed=2, years=[(2012, "Summer")], n=300), replace=True)
+    assert version == data_version()
+    assert_same_as_rebuild(version)
+
+
+def test_games_of_final_df_can_not_be_ingested(data_dir):
+    with pytest.raises(ValueError, match="part of final_df.csv"):
+        ingest.ingest_events(new_games(seed=1, years=[(2004, "Summer")]))
+    assert not os.path.exists(data_dir / "ingested") or not os.listdir(data_dir / "ingested")
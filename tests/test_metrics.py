@@ -0,0 +1,40 @@
+import multiprocessing
+import os
+
+from metrics import RETIRED_FILE, Metrics
+
+
+def count_requests(directory, requests):
+    metrics = Metrics(directory=directory)
+    metrics.increment("requests_total", requests)
+    metrics.flush()
+
+
+def requests_total(metrics):
+    lines = [line for line in metrics.render().splitlines() if line.startswith("requests_total")]
+    return int(lines[0].split()[-1]) if lines else 0
+
+
+def test_stopped_workers_are_retired(tmp_path):
+    for requests in [2, 3]:
+        process = multiprocessing.Process(target=count_requests, args=(str(tmp_path), requests))
+        process.start()
+        process.join()
+    metrics = Metrics(directory=str(tmp_path))
+    metrics.increment("requests_total")
+    assert requests_total(metrics) == 6
+    # Only the retired workers and the running one are left, and the sum stays the same
+    own = os.path.basename(metrics._worker_path())
+    assert sorted(name for name in os.listdir(tmp_path) if name.endswith(".json")) == [RETIRED_FILE, own]
+    assert requests_total(metrics) == 6
+
+
+def test_a_reused_pid_does_not_overwrite_a_stopped_worker(tmp_path, monkeypatch):
+    monkeypatch.setattr(os, "getpid", lambda: 1234)
+    stopped = Metrics(directory=str(tmp_path))
+    stopped.increment("requests_total", 5)
+    stopped.flush()
+    stopped._alive.close()
+    metrics = Metrics(directory=str(tmp_path))
+    metrics.increment("requests_total")
+    assert requests_total(metrics) == 6
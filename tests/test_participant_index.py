@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from data_store import aggregate_events, compact_frame, sort_grouped
+from filter_index import FilterIndex
+from participant_index import ParticipantIndex, take_groups
+
+
+def test_take_groups_matches_slicing():
+    rng = np.random.default_rng(1)
+    counts = rng.integers(0, 5, 50)
+    ids = rng.integers(0, 1000, counts.sum())
+    starts = np.cumsum(counts) - counts
+    # Repeated rows, rows without IDs and an unsorted order
+    for rows in [np.arange(50), rng.permutation(50), np.array([3, 3, 0, 49]), np.flatnonzero(counts == 0),
+                 np.empty(0, dtype=np.int64)]:
+        expected = [i for row in rows for i in ids[starts[row]:starts[row] + counts[row]]]
+        np.testing.assert_array_equal(take_groups(ids, counts, rows), np.array(expected, dtype=ids.dtype))
+
+
+@pytest.fixture
+def grouped(events):
+    # Compacted and sorted like the frames of the app, with the IDs moved along with their rows
+    grouped, participant_ids = aggregate_events(events)
+    frames = sort_grouped(compact_frame(grouped), participant_ids, by="Number of Medals", ascending=False)
+    return frames["grouped_final_athlete_events"], frames["participant_ids"]
+
+
+def test_the_ids_of_every_row_are_its_distinct_athletes(events, grouped):
+    grouped, participant_ids = grouped
+    index = ParticipantIndex(grouped, participant_ids["ID"])
+    row = int(np.argmax(grouped["Participants"].to_numpy()))
+    key = grouped.iloc[row]
+    athletes = events[(events["Year"] == key["Year"]) & (events["Sport"] == key["Sport"])
+                      & (events["Country"] == key["Country"]) & (events["Medal"].fillna("No Medal") == key["Medal"])]
+    assert sorted(take_groups(index.ids, index.counts, [row])) == sorted(athletes["Participants"].unique())
+
+
+@pytest.mark.parametrize("filters", [
+    {},
+    {"Year": [2004]},
+    {"Year": [2000, 2002, 2008], "Sport": ["Rowing", "Skiing"]},
+    {"Season": ["Winter"], "Country": ["Norway"]},
+    {"Year": [1900]},
+])
+@pytest.mark.parametrize("column", ["Country", "Sport"])
+def test_count_matches_nunique(events, grouped, filters, column):
+    grouped, participant_ids = grouped
+    rows = FilterIndex(grouped).select(**filters)
+    counts = ParticipantIndex(grouped, participant_ids["ID"]).count(rows, column)
+
+    mask = np.ones(len(events), dtype=bool)
+    for name, values in filters.items():
+        mask &= events[name].isin(values).to_numpy()
+    expected = events[mask].groupby(column, observed=True)["Participants"].nunique()
+    categories = grouped[column].cat.categories
+    assert dict(zip(categories, counts.tolist())) == {value: expected.get(value, 0) for value in categories}
+
+
+def test_ids_must_match_the_participants(grouped):
+    grouped, participant_ids = grouped
+    with pytest.raises(ValueError):
+        ParticipantIndex(grouped, participant_ids["ID"][1:])